@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils import timezone
 
 from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                      ShoppingCart, Subscription, Tag)
@@ -13,10 +14,32 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientInline,)
     list_display = ['name', 'author']
     list_filter = ('name', 'author', 'tags',)
-    readonly_fields = ('added_to_favorites',)
+    readonly_fields = ('added_to_favorites', 'shopping_cart_count',)
+    exclude = ('favorites_count',)
 
     def added_to_favorites(self, instance):
-        return instance.in_favorites.count()
+        return instance.favorites_count
+
+
+@admin.register(IngredientInRecipe)
+class IngredientInRecipeAdmin(admin.ModelAdmin):
+    def touch_recipes(self, recipe_ids):
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            updated_at=timezone.now(),
+        )
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.touch_recipes([obj.recipe_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.touch_recipes([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self.touch_recipes(recipe_ids)
 
 
 @admin.register(Ingredient)
@@ -26,7 +49,6 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Recipe, RecipeAdmin)
-admin.site.register(IngredientInRecipe)
 admin.site.register(Tag)
 admin.site.register(Subscription)
 admin.site.register(Favorite)
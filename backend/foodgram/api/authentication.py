@@ -0,0 +1,136 @@
+import copy
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+
+class TokenCache:
+    """Кэш пользователей по ключу токена.
+
+    По умолчанию это LRU в памяти процесса размером TOKEN_CACHE_SIZE
+    с коротким временем жизни TOKEN_CACHE_TTL. Сигналы удаляют запись
+    в текущем воркере сразу, а в остальных воркерах отозванный токен
+    принимается не дольше TOKEN_CACHE_TTL секунд.
+
+    С TOKEN_CACHE_SHARED кэш Django должен быть общим для всех
+    воркеров. Пользователь хранится в нём вместе с версией записи, а в
+    LRU процесса - с версией, под которой он был прочитан. Каждое
+    попадание в LRU сверяется с версией в кэше Django, поэтому выход из
+    системы и изменение пользователя сразу видны во всех воркерах.
+    Отзыв оставляет вместо версии метку REVOKED на TOKEN_CACHE_TTL
+    секунд, чтобы запрос, прочитавший пользователя из базы до отзыва,
+    не вернул его в кэш.
+    """
+
+    REVOKED = 'revoked'
+
+    def __init__(self):
+        self.lock = Lock()
+        self.entries = OrderedDict()
+
+    @property
+    def shared(self):
+        return settings.TOKEN_CACHE_SHARED
+
+    def shared_key(self, key):
+        return f'auth_token:{key}'
+
+    def version_key(self, key):
+        return f'auth_token_version:{key}'
+
+    def get(self, key):
+        now = monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None:
+            user, version, expires_at = entry
+            if expires_at > now and (
+                not self.shared
+                or cache.get(self.version_key(key)) == version
+            ):
+                with self.lock:
+                    if key in self.entries:
+                        self.entries.move_to_end(key)
+                return copy.copy(user)
+            self.forget(key)
+        if not self.shared:
+            return None
+        shared = cache.get_many([self.shared_key(key), self.version_key(key)])
+        entry = shared.get(self.shared_key(key))
+        if entry is None:
+            return None
+        version, user = entry
+        if shared.get(self.version_key(key)) != version:
+            return None
+        self.remember(key, user, version)
+        return copy.copy(user)
+
+    def set(self, key, user):
+        if not self.shared:
+            self.remember(key, user, None)
+            return
+        version = uuid.uuid4().hex
+        if not cache.add(
+            self.version_key(key),
+            version,
+            settings.TOKEN_CACHE_SHARED_TTL,
+        ):
+            return
+        cache.set(
+            self.shared_key(key),
+            (version, user),
+            settings.TOKEN_CACHE_SHARED_TTL,
+        )
+        self.remember(key, user, version)
+
+    def remember(self, key, user, version):
+        with self.lock:
+            self.entries[key] = (
+                user,
+                version,
+                monotonic() + settings.TOKEN_CACHE_TTL,
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def forget(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def invalidate(self, *keys):
+        self.forget(*keys)
+        if not self.shared or not keys:
+            return
+        cache.set_many(
+            {self.version_key(key): self.REVOKED for key in keys},
+            settings.TOKEN_CACHE_TTL,
+        )
+        cache.delete_many([self.shared_key(key) for key in keys])
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену, которая берёт пользователя из
+    token_cache и обращается к базе только при промахе
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+            return user, token
+        if not user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return user, Token(key=key, user=user)
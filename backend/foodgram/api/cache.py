@@ -0,0 +1,89 @@
+from collections import namedtuple
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+
+from .models import CatalogVersion, Ingredient, Tag
+
+CatalogSnapshot = namedtuple(
+    'CatalogSnapshot',
+    ('version', 'updated_at', 'objects', 'ids', 'payload'),
+)
+
+
+class CatalogCache:
+    """Кэш справочника в памяти процесса.
+
+    Хранит объекты справочника, множество их id и заранее
+    сериализованный JSON списка. Актуальность проверяется по версии
+    из CatalogVersion, которую увеличивает любой процесс, изменивший
+    справочник, поэтому кэш остаётся согласованным между воркерами.
+    Версия перечитывается не чаще, чем раз в CATALOG_CACHE_TTL секунд.
+    """
+
+    def __init__(self, name, model, serializer_path):
+        self.name = name
+        self.model = model
+        self.serializer_path = serializer_path
+        self.lock = Lock()
+        self.snapshot = None
+        self.checked_at = None
+
+    def get_version(self):
+        version = CatalogVersion.objects.filter(name=self.name).values_list(
+            'version',
+            'updated_at',
+        ).first()
+        return version or (0, None)
+
+    def get(self):
+        now = monotonic()
+        snapshot = self.snapshot
+        if (snapshot is not None and self.checked_at is not None
+                and now - self.checked_at < settings.CATALOG_CACHE_TTL):
+            return snapshot
+        version, updated_at = self.get_version()
+        with self.lock:
+            if self.snapshot is None or self.snapshot.version != version:
+                self.snapshot = self.build(version, updated_at)
+            self.checked_at = now
+            return self.snapshot
+
+    def build(self, version, updated_at):
+        objects = list(self.model.objects.all())
+        serializer_class = import_string(self.serializer_path)
+        data = serializer_class(objects, many=True).data
+        return CatalogSnapshot(
+            version=version,
+            updated_at=updated_at,
+            objects=objects,
+            ids=frozenset(obj.pk for obj in objects),
+            payload=JSONRenderer().render(data),
+        )
+
+    def invalidate(self):
+        updated = CatalogVersion.objects.filter(name=self.name).update(
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            CatalogVersion.objects.get_or_create(
+                name=self.name,
+                defaults={'version': 1},
+            )
+        with self.lock:
+            self.snapshot = None
+            self.checked_at = None
+
+
+tag_catalog = CatalogCache('tag', Tag, 'api.serializers.TagSerializer')
+ingredient_catalog = CatalogCache(
+    'ingredient',
+    Ingredient,
+    'api.serializers.IngredientSerializer',
+)
@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Recipe, ShoppingCart, Subscription
+
+User = get_user_model()
+
+
+def count_subquery(queryset, field):
+    """Возвращает подзапрос с количеством объектов queryset, у которых
+    поле field ссылается на текущую строку внешнего запроса
+    """
+
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def refresh_recipe_counters(recipes=None):
+    """Пересчитывает счётчики избранного и списка покупок рецептов
+    """
+
+    if recipes is None:
+        recipes = Recipe.objects.all()
+    return recipes.update(
+        favorites_count=count_subquery(Favorite.objects.all(), 'recipe'),
+        shopping_cart_count=count_subquery(
+            ShoppingCart.objects.all(),
+            'recipe',
+        ),
+    )
+
+
+def refresh_user_counters(users=None):
+    """Пересчитывает счётчики рецептов и подписчиков пользователей
+    """
+
+    if users is None:
+        users = User.objects.all()
+    return users.update(
+        recipes_count=count_subquery(Recipe.objects.all(), 'author'),
+        subscribers_count=count_subquery(
+            Subscription.objects.all(),
+            'subscriptions',
+        ),
+    )
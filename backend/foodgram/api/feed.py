@@ -0,0 +1,89 @@
+from .models import FeedItem, Recipe, Subscription
+
+BATCH_SIZE = 1000
+
+
+def fan_out_recipe(recipe):
+    """Добавляет новый рецепт в ленты всех подписчиков его автора
+    """
+
+    subscribers = Subscription.objects.filter(
+        subscriptions=recipe.author_id,
+    ).values_list('user_id', flat=True)
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(
+                user_id=user_id,
+                recipe_id=recipe.pk,
+                author_id=recipe.author_id,
+                pub_date=recipe.pub_date,
+            )
+            for user_id in subscribers
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def follow(user, author_ids):
+    """Добавляет в ленту пользователя рецепты авторов author_ids
+    """
+
+    recipes = Recipe.objects.filter(author__in=author_ids).values_list(
+        'pk', 'author_id', 'pub_date',
+    )
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(
+                user=user,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, author_id, pub_date in recipes
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def unfollow(user, author_ids):
+    """Удаляет из ленты пользователя рецепты авторов author_ids
+    """
+
+    FeedItem.objects.filter(user=user, author__in=author_ids).delete()
+
+
+def rebuild_feed(users=None):
+    """Пересобирает ленты пользователей users, а без аргумента - все
+    ленты, по текущим подпискам. Возвращает число записей в лентах
+    """
+
+    items = FeedItem.objects.all()
+    subscriptions = Subscription.objects.all()
+    if users is not None:
+        items = items.filter(user__in=users)
+        subscriptions = subscriptions.filter(user__in=users)
+    items.delete()
+    rows = subscriptions.filter(
+        subscriptions__recipes__isnull=False,
+    ).values_list(
+        'user_id',
+        'subscriptions__recipes__id',
+        'subscriptions_id',
+        'subscriptions__recipes__pub_date',
+    ).order_by()
+    created = 0
+    batch = []
+    for user_id, recipe_id, author_id, pub_date in rows.iterator(BATCH_SIZE):
+        batch.append(FeedItem(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        ))
+        if len(batch) == BATCH_SIZE:
+            created += len(FeedItem.objects.bulk_create(batch))
+            batch = []
+    created += len(FeedItem.objects.bulk_create(batch))
+    return created
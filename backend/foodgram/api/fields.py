@@ -0,0 +1,164 @@
+import binascii
+import uuid
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+from .thumbnails import thumbnail_url
+
+BASE64_MARKER = ';base64,'
+# Кратно 4, чтобы каждый кусок декодировался независимо
+BASE64_CHUNK_SIZE = 256 * 1024
+# Заголовки JPEG с EXIF и ICC-профилями укладываются в этот объём
+IMAGE_HEADER_LIMIT = 1024 * 1024
+
+
+def open_image_header(head):
+    """Возвращает картинку, открытую по первым байтам файла head, или
+    None, если заголовок прочитан не полностью.
+
+    Image.open читает только заголовок и не декодирует пиксели, но
+    для заголовка с огромными размерами бросает DecompressionBombError.
+    """
+
+    try:
+        return Image.open(BytesIO(head))
+    except OSError:
+        return None
+
+
+class ThumbnailField(serializers.ReadOnlyField):
+    """Поле для вывода URL уменьшенной копии картинки рецепта или URL
+    оригинала, пока копии не созданы
+    """
+
+    def __init__(self, size, **kwargs):
+        self.size = size
+        kwargs.setdefault('source', '*')
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        if recipe.thumbnails_ready:
+            url = thumbnail_url(recipe.image, self.size)
+        else:
+            url = recipe.image.url
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class StreamingImageField(serializers.ImageField):
+    """Поле для загрузки картинки строкой data:image/...;base64,... или
+    файлом из multipart-запроса.
+
+    Строка base64 декодируется кусками во временный файл, поэтому в
+    памяти не появляется полная копия картинки. Размер файла
+    оценивается по длине строки до декодирования, а формат и размеры
+    картинки проверяются по заголовку, как только он будет прочитан.
+    """
+
+    default_error_messages = {
+        'too_large': 'Размер картинки не должен превышать {max_size} байт',
+        'bad_format': 'Допустимые форматы картинки: {formats}',
+        'too_big': (
+            'Ширина и высота картинки не должны превышать {max_dimension}'
+        ),
+        'bad_base64': 'Некорректная строка base64',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            if data.startswith('http'):
+                raise SkipField()
+            if not data.startswith('data:'):
+                self.fail('invalid')
+            data = self.decode(data)
+        elif hasattr(data, 'read'):
+            self.check_size(getattr(data, 'size', 0))
+            self.check_header(data)
+        else:
+            self.fail('invalid')
+        return super().to_internal_value(data)
+
+    def check_size(self, size):
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+
+    def check_image(self, image):
+        if image.format not in settings.RECIPE_IMAGE_FORMATS:
+            self.fail(
+                'bad_format',
+                formats=', '.join(settings.RECIPE_IMAGE_FORMATS),
+            )
+        if max(image.size) > settings.RECIPE_IMAGE_MAX_DIMENSION:
+            self.fail(
+                'too_big',
+                max_dimension=settings.RECIPE_IMAGE_MAX_DIMENSION,
+            )
+
+    def open_header(self, head):
+        try:
+            return open_image_header(head)
+        except Image.DecompressionBombError:
+            self.fail(
+                'too_big',
+                max_dimension=settings.RECIPE_IMAGE_MAX_DIMENSION,
+            )
+
+    def check_header(self, file):
+        image = self.open_header(file.read(IMAGE_HEADER_LIMIT))
+        file.seek(0)
+        if image is None:
+            self.fail('invalid_image')
+        self.check_image(image)
+
+    def decode(self, data):
+        start = data.find(BASE64_MARKER)
+        if start == -1:
+            self.fail('bad_base64')
+        extension = data[data.find('/') + 1:start]
+        start += len(BASE64_MARKER)
+        length = len(data) - start
+        padding = data.count('=', len(data) - 2)
+        size = length // 4 * 3 - padding
+        self.check_size(size)
+        file = TemporaryUploadedFile(
+            f'{uuid.uuid4()}.{extension}',
+            f'image/{extension}',
+            size,
+            None,
+        )
+        head = bytearray()
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                chunk = binascii.a2b_base64(
+                    data[offset:offset + BASE64_CHUNK_SIZE]
+                )
+                if head is not None:
+                    head += chunk
+                    image = self.open_header(bytes(head))
+                    if image is not None:
+                        self.check_image(image)
+                        head = None
+                    elif len(head) >= IMAGE_HEADER_LIMIT:
+                        self.fail('invalid_image')
+                file.write(chunk)
+        except binascii.Error:
+            file.close()
+            self.fail('bad_base64')
+        except serializers.ValidationError:
+            file.close()
+            raise
+        if head is not None:
+            file.close()
+            self.fail('invalid_image')
+        file.size = file.tell()
+        file.seek(0)
+        return file
@@ -1,13 +1,45 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filter
 
-from .models import Ingredient, Recipe
+from .cache import tag_catalog
+from .models import Recipe
+
+
+def get_tag_choices():
+    return [(tag.slug, tag.name) for tag in tag_catalog.get().objects]
+
+
+class TagSlugFilter(filter.MultipleChoiceFilter):
+    """Фильтр рецептов по слагам тэгов.
+
+    Допустимые слаги берутся из кэша справочника тэгов, а рецепты
+    отбираются подзапросом EXISTS по связующей таблице, поэтому рецепт
+    с несколькими подходящими тэгами не дублируется и DISTINCT не нужен.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', get_tag_choices)
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        slugs = set(value)
+        tag_ids = [
+            tag.pk for tag in tag_catalog.get().objects
+            if tag.slug in slugs
+        ]
+        return qs.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=tag_ids,
+        )))
 
 
 class RecipeFilter(filter.FilterSet):
     """Фильтр для модели Recipe
     """
 
-    tags = filter.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = TagSlugFilter()
     is_favorited = filter.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filter.BooleanFilter(
         method='get_is_in_shopping_cart'
@@ -26,19 +58,3 @@ class RecipeFilter(filter.FilterSet):
         if not value:
             return queryset
         return queryset.filter(in_shopping_cart__user=self.request.user)
-
-
-class IngredientSearchFilter(filter.FilterSet):
-    """Фильтр для модели Ingredient
-    """
-
-    name = filter.CharFilter(method='search_by_name')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
-
-    def search_by_name(self, queryset, name, value):
-        if not value:
-            return queryset
-        return queryset.filter(name__startswith=value)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.query_plans import (FULL_SCAN, hot_queries, plan_problems,
+                             postgresql_queries, prefer_indexes)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run EXPLAIN for the hot queries and fail if any of them scans '
+        'a whole table instead of using an index'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Print the plan of every query',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in FULL_SCAN:
+            raise CommandError(
+                f'Планы запросов для {connection.vendor} не поддерживаются'
+            )
+        queries = hot_queries(1, 1, 1)
+        if connection.vendor == 'postgresql':
+            queries += postgresql_queries()
+        failed = []
+        with transaction.atomic(), prefer_indexes():
+            for name, queryset, tables, ordered in queries:
+                plan, problems = plan_problems(queryset, tables, ordered)
+                if problems:
+                    failed.append(name)
+                    self.stdout.write(self.style.ERROR(
+                        f'{name}: {", ".join(problems)}'
+                    ))
+                else:
+                    self.stdout.write(f'{name}: index')
+                if problems or options['verbose_plans']:
+                    self.stdout.write(plan)
+        if failed:
+            raise CommandError(
+                f'Запросы без индекса: {", ".join(failed)}'
+            )
+        self.stdout.write(self.style.SUCCESS('All hot queries use indexes'))
@@ -0,0 +1,99 @@
+import posixpath
+import re
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import Recipe
+from api.signals import delete_unused_image
+from api.storage import content_hash, content_name, image_storage
+from api.thumbnails import (delete_thumbnails, make_thumbnails,
+                            mark_thumbnails_ready)
+
+HASHED_NAME = re.compile(r'^[0-9a-f]{64}\.\w+$')
+
+
+class Command(BaseCommand):
+    help = (
+        'Rename recipe images to content hashes, merge identical files '
+        'and rewrite Recipe.image paths'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be merged',
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help=(
+                'Also delete stored images that no recipe references, '
+                'e.g. files kept by an interrupted upload'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        names = Recipe.objects.exclude(image='').values_list(
+            'image',
+            flat=True,
+        ).order_by().distinct()
+        renamed = merged = missing = freed = 0
+        targets = set()
+        for name in list(names):
+            if not image_storage.exists(name):
+                missing += 1
+                self.stderr.write(f'{name}: file is missing')
+                continue
+            with image_storage.open(name) as file:
+                target = content_name(name, content_hash(file))
+            if target == name:
+                continue
+            duplicate = target in targets or image_storage.exists(target)
+            targets.add(target)
+            if duplicate:
+                merged += 1
+                freed += image_storage.size(name)
+            else:
+                renamed += 1
+            self.stdout.write(f'{name} -> {target}')
+            if dry_run:
+                continue
+            if not duplicate:
+                with image_storage.open(name) as file:
+                    image_storage.save(target, file)
+            Recipe.objects.filter(image=name).update(
+                image=target,
+                thumbnails_ready=False,
+                updated_at=timezone.now(),
+            )
+            image_storage.delete(name)
+            delete_thumbnails(name)
+            make_thumbnails(target)
+            mark_thumbnails_ready(target)
+        pruned = self.prune(dry_run) if options['prune'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Renamed: {renamed}, merged duplicates: {merged}, '
+            f'missing files: {missing}, freed: {freed} bytes, '
+            f'pruned: {pruned}'
+            + (' (dry run)' if dry_run else '')
+        ))
+
+    def prune(self, dry_run):
+        directory = Recipe._meta.get_field('image').upload_to
+        _, files = image_storage.listdir(directory)
+        pruned = 0
+        for filename in files:
+            if not HASHED_NAME.match(filename):
+                continue
+            name = posixpath.join(directory, filename)
+            if dry_run:
+                unused = not Recipe.objects.filter(image=name).exists()
+            else:
+                unused = delete_unused_image(name)
+            if unused:
+                pruned += 1
+                self.stdout.write(f'{name}: unused')
+        return pruned
@@ -0,0 +1,174 @@
+import random
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.cache import tag_catalog
+from api.counters import refresh_recipe_counters, refresh_user_counters
+from api.feed import rebuild_feed
+from api.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                        ShoppingCart, Subscription, Tag)
+from api.storage import image_storage
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+def placeholder_image():
+    """Сохраняет одну картинку для всех сгенерированных рецептов.
+
+    Хранилище рецептов адресует файлы по содержимому, поэтому
+    повторные запуски используют тот же файл.
+    """
+
+    buffer = BytesIO()
+    Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'JPEG')
+    return image_storage.save(
+        'api/images/recipes/benchmark.jpg',
+        ContentFile(buffer.getvalue()),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic dataset of users, recipes, subscriptions, '
+        'favorites and shopping carts for benchmarks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes-per-user', type=int, default=5)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix',
+            default='bench',
+            help='Prefix for generated usernames and emails',
+        )
+        parser.add_argument('--password', default='benchmark')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже существуют'
+            )
+        if not Ingredient.objects.exists():
+            call_command('load_data', stdout=self.stdout)
+        ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        Tag.objects.bulk_create(
+            [Tag(name=name, color=color, slug=slug)
+             for name, color, slug in TAGS],
+            ignore_conflicts=True,
+        )
+        tag_catalog.invalidate()
+        tag_ids = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+        image = placeholder_image()
+        password = make_password(options['password'])
+
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name='Benchmark',
+                    last_name=str(number),
+                    password=password,
+                )
+                for number in range(options['users'])
+            ], batch_size=BATCH_SIZE)
+            users = User.objects.filter(username__startswith=prefix)
+            user_ids = list(
+                users.order_by('pk').values_list('pk', flat=True)
+            )
+            Token.objects.bulk_create([
+                Token(key=Token.generate_key(), user_id=user_id)
+                for user_id in user_ids
+            ], batch_size=BATCH_SIZE)
+
+            Recipe.objects.bulk_create([
+                Recipe(
+                    author_id=user_id,
+                    name=f'Рецепт {number} пользователя {user_id}',
+                    image=image,
+                    text='Синтетический рецепт для нагрузочных тестов',
+                    cooking_time=rng.randint(5, 120),
+                )
+                for user_id in user_ids
+                for number in range(options['recipes_per_user'])
+            ], batch_size=BATCH_SIZE)
+            recipes = Recipe.objects.filter(author__in=user_ids)
+            recipe_ids = list(
+                recipes.order_by('pk').values_list('pk', flat=True)
+            )
+
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in self.sample(
+                    rng, tag_ids, options['tags_per_recipe'],
+                )
+            ], batch_size=BATCH_SIZE)
+            IngredientInRecipe.objects.bulk_create([
+                IngredientInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in self.sample(
+                    rng, ingredient_ids, options['ingredients_per_recipe'],
+                )
+            ], batch_size=BATCH_SIZE)
+
+            Subscription.objects.bulk_create([
+                Subscription(user_id=user_id, subscriptions_id=author_id)
+                for user_id in user_ids
+                for author_id in self.sample_authors(
+                    rng, user_ids, user_id, options['follows_per_user'],
+                )
+            ], batch_size=BATCH_SIZE)
+            for model, count in ((Favorite, options['favorites_per_user']),
+                                 (ShoppingCart, options['cart_per_user'])):
+                model.objects.bulk_create([
+                    model(user_id=user_id, recipe_id=recipe_id)
+                    for user_id in user_ids
+                    for recipe_id in self.sample(rng, recipe_ids, count)
+                ], batch_size=BATCH_SIZE)
+
+            refresh_recipe_counters(recipes)
+            refresh_user_counters(users)
+            rebuild_feed(users)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(user_ids)} users and {len(recipe_ids)} recipes '
+            f'(prefix {prefix}, seed {options["seed"]}, '
+            f'password {options["password"]})'
+        ))
+
+    def sample(self, rng, population, count):
+        return rng.sample(population, min(count, len(population)))
+
+    def sample_authors(self, rng, user_ids, user_id, count):
+        authors = self.sample(rng, user_ids, count + 1)
+        return [pk for pk in authors if pk != user_id][:count]
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.models import Recipe
+from api.thumbnails import make_thumbnails, mark_thumbnails_ready
+
+
+class Command(BaseCommand):
+    help = 'Create missing thumbnails for existing recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='Re-create thumbnails that already exist',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.THUMBNAIL_WORKERS,
+        )
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(image='').values_list(
+            'image',
+            flat=True,
+        ).order_by().distinct()
+        created = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(
+                    make_thumbnails,
+                    name,
+                    overwrite=options['overwrite'],
+                ): name
+                for name in names.iterator()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    created += future.result()
+                    mark_thumbnails_ready(name)
+                except Exception as error:
+                    self.stderr.write(f'{name}: {error}')
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Thumbnails created: {created}, failed images: {failed}'
+        ))
@@ -1,18 +1,150 @@
 import csv
+import json
+import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.signals import post_delete
 
+from api.cache import ingredient_catalog
 from api.models import Ingredient
+from api.signals import invalidate_ingredient_catalog
+
+DEFAULT_PATH = os.path.join(
+    settings.BASE_DIR, 'api', 'data', 'ingredients.csv',
+)
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+def read_json_lines(file):
+    for line in file:
+        if line.strip():
+            item = json.loads(line)
+            yield item['name'], item['measurement_unit']
+
+
+def read_json(file):
+    """Читает JSON-массив объектов по одному, не загружая файл в память
+    целиком
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив ингредиентов')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+        if not chunk:
+            if buffer.strip():
+                raise CommandError('JSON-файл с ингредиентами обрезан')
+            return
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+    '.jsonl': read_json_lines,
+}
 
 
 class Command(BaseCommand):
     help = 'Load ingredients data to DB'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=DEFAULT_PATH,
+            help='CSV, JSON array or JSON lines file with ingredients',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--truncate',
+            action='store_true',
+            help='Delete ingredients that no recipe uses before loading',
+        )
+
     def handle(self, *args, **options):
-        with open('api/data/ingredients.csv', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit)
+        path = options['path']
+        _, extension = os.path.splitext(path)
+        reader = READERS.get(extension.lower())
+        if reader is None:
+            raise CommandError(
+                f'Неизвестный формат {extension}, '
+                f'ожидается один из: {", ".join(READERS)}'
+            )
+        started = time.perf_counter()
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            deleted = 0
+            if options['truncate']:
+                # Справочник сбрасывается один раз после загрузки, поэтому
+                # сигнал на удаление каждой строки отключается
+                unused = Ingredient.objects.filter(
+                    ingredient_in_recipe__isnull=True,
+                )
+                post_delete.disconnect(
+                    invalidate_ingredient_catalog,
+                    sender=Ingredient,
+                )
+                try:
+                    deleted, _ = Ingredient.objects.filter(
+                        pk__in=unused.values('pk'),
+                    ).delete()
+                finally:
+                    post_delete.connect(
+                        invalidate_ingredient_catalog,
+                        sender=Ingredient,
+                    )
+            before = Ingredient.objects.count()
+            rows = reader(file)
+            total = 0
+            while True:
+                batch = [
+                    Ingredient(
+                        name=name.strip(),
+                        measurement_unit=measurement_unit.strip(),
+                    )
+                    for name, measurement_unit in islice(
+                        rows,
+                        options['batch_size'],
+                    )
+                ]
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+            created = Ingredient.objects.count() - before
+        ingredient_catalog.invalidate()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {total} rows in {elapsed:.2f}s '
+            f'({total / elapsed:.0f} rows/s): {created} created, '
+            f'{total - created} already present, {deleted} deleted'
+        ))
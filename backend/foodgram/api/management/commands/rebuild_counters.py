@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import refresh_recipe_counters, refresh_user_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild denormalized recipe and user counters from scratch'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipes = refresh_recipe_counters()
+            users = refresh_user_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Counters rebuilt: {recipes} recipes, {users} users'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.feed import rebuild_feed
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized recipe feeds from current subscriptions'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            items = rebuild_feed()
+        self.stdout.write(self.style.SUCCESS(
+            f'Feeds rebuilt: {items} items'
+        ))
@@ -0,0 +1,201 @@
+import base64
+import json
+import random
+import subprocess
+import time
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.models import Ingredient, Recipe, Tag
+
+SCENARIOS = (
+    'list', 'detail', 'create', 'subscriptions', 'feed', 'download',
+)
+
+
+def percentile(values, fraction):
+    """Возвращает перцентиль fraction методом ближайшего ранга
+    """
+
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def encoded_image():
+    buffer = BytesIO()
+    Image.new('RGB', (320, 240), '#49B64E').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue(),
+    ).decode()
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the API routes through the test client and save '
+        'throughput, latency percentiles and query counts as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix',
+            default='bench',
+            help='Prefix of the users created by generate_dataset',
+        )
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=SCENARIOS,
+            help='Run only the given scenarios (repeatable)',
+        )
+        parser.add_argument('--output', help='Path of the JSON report')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть больше нуля')
+        rng = random.Random(options['seed'])
+        token = Token.objects.filter(
+            user__username__startswith=options['prefix'],
+        ).select_related('user').order_by('user_id').first()
+        if token is None:
+            raise CommandError(
+                'Нет пользователей для бенчмарка, запустите generate_dataset'
+            )
+        recipe_ids = list(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        tag_ids = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+        ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list(
+                'pk',
+                flat=True,
+            )[:500]
+        )
+        image = encoded_image()
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        def create():
+            return client.post(
+                '/api/recipes/',
+                {
+                    'name': 'Бенчмарк',
+                    'text': 'Рецепт из бенчмарка',
+                    'cooking_time': 10,
+                    'image': image,
+                    'tags': rng.sample(tag_ids, min(2, len(tag_ids))),
+                    'ingredients': [
+                        {'id': pk, 'amount': rng.randint(1, 500)}
+                        for pk in rng.sample(
+                            ingredient_ids, min(8, len(ingredient_ids)),
+                        )
+                    ],
+                },
+                content_type='application/json',
+            )
+
+        requests = {
+            'list': lambda: client.get('/api/recipes/'),
+            'detail': lambda: client.get(
+                f'/api/recipes/{rng.choice(recipe_ids)}/'
+            ),
+            'create': create,
+            'subscriptions': lambda: client.get(
+                '/api/users/subscriptions/?recipes_limit=3'
+            ),
+            'feed': lambda: client.get('/api/recipes/feed/'),
+            'download': lambda: client.get(
+                '/api/recipes/download_shopping_cart/'
+            ),
+        }
+        results = {}
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        ), transaction.atomic():
+            for name in options['scenario'] or SCENARIOS:
+                results[name] = self.run_scenario(
+                    requests[name],
+                    options['iterations'],
+                    options['warmup'],
+                )
+                self.report(name, results[name])
+            # Созданные рецепты не должны влиять на следующие прогоны
+            transaction.set_rollback(True)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'commit': get_commit(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'iterations': options['iterations'],
+            'dataset': {
+                'recipes': len(recipe_ids),
+                'user': token.user.email,
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Report saved to {options["output"]}')
+
+    def run_scenario(self, request, iterations, warmup):
+        for _ in range(warmup):
+            request()
+        latencies = []
+        queries = []
+        statuses = set()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                request_started = time.perf_counter()
+                response = request()
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                latencies.append(time.perf_counter() - request_started)
+            queries.append(len(context.captured_queries))
+            statuses.add(response.status_code)
+        elapsed = time.perf_counter() - started
+        return {
+            'requests': iterations,
+            'throughput': iterations / elapsed,
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'queries_mean': sum(queries) / len(queries),
+            'queries_max': max(queries),
+            'statuses': sorted(statuses),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:14} {result["throughput"]:8.1f} req/s  '
+            f'p50 {result["p50_ms"]:7.2f} ms  '
+            f'p95 {result["p95_ms"]:7.2f} ms  '
+            f'queries {result["queries_mean"]:.1f} '
+            f'(max {result["queries_max"]})  '
+            f'status {result["statuses"]}'
+        )
@@ -0,0 +1,129 @@
+import logging
+from collections import defaultdict
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+METRICS = (
+    ('requests_total', 'counter', 'Количество запросов'),
+    ('queries_total', 'counter', 'Количество SQL-запросов'),
+    ('db_seconds_total', 'counter', 'Время выполнения SQL-запросов'),
+    ('serializer_seconds_total', 'counter', 'Время работы сериализаторов'),
+    ('response_bytes_total', 'counter', 'Размер ответов'),
+    ('duration_seconds_total', 'counter', 'Время обработки запросов'),
+    ('budget_exceeded_total', 'counter', 'Количество превышений бюджета'),
+)
+
+
+class RequestMetrics:
+    """Метрики одного запроса.
+
+    Экземпляр подключается к соединению с базой через
+    connection.execute_wrapper и считает запросы и время их выполнения.
+    Время работы сериализаторов добавляет MetricsMixin.
+    """
+
+    def __init__(self):
+        self.endpoint = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.started = perf_counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - started
+            self.queries += 1
+
+    def timed(self, method):
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.serializer_time += perf_counter() - started
+
+        return wrapper
+
+    def server_timing(self, duration):
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'serializer;dur={self.serializer_time * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+
+
+def get_budget(endpoint):
+    budget = dict(settings.REQUEST_BUDGET_DEFAULT)
+    budget.update(settings.REQUEST_BUDGETS.get(endpoint, {}))
+    return budget
+
+
+class MetricsRegistry:
+    """Накопленные метрики по эндпоинтам в памяти процесса
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.values = defaultdict(lambda: defaultdict(float))
+
+    def record(self, metrics, duration, size):
+        """Сохраняет метрики запроса и пишет предупреждение в лог, если
+        запрос вышел за бюджет эндпоинта
+        """
+
+        budget = get_budget(metrics.endpoint)
+        exceeded = []
+        if metrics.queries > budget.get('queries', float('inf')):
+            exceeded.append(
+                f'{metrics.queries} queries > {budget["queries"]}'
+            )
+        if metrics.db_time * 1000 > budget.get('db_ms', float('inf')):
+            exceeded.append(
+                f'{metrics.db_time * 1000:.1f} ms in DB > {budget["db_ms"]}'
+            )
+        if exceeded:
+            logger.warning(
+                'Превышен бюджет %s: %s',
+                metrics.endpoint,
+                ', '.join(exceeded),
+            )
+        with self.lock:
+            values = self.values[metrics.endpoint]
+            values['requests_total'] += 1
+            values['queries_total'] += metrics.queries
+            values['db_seconds_total'] += metrics.db_time
+            values['serializer_seconds_total'] += metrics.serializer_time
+            values['response_bytes_total'] += size
+            values['duration_seconds_total'] += duration
+            values['budget_exceeded_total'] += bool(exceeded)
+
+    def render(self):
+        """Возвращает метрики в текстовом формате Prometheus
+        """
+
+        with self.lock:
+            values = {
+                endpoint: dict(metrics)
+                for endpoint, metrics in self.values.items()
+            }
+        lines = []
+        for key, kind, description in METRICS:
+            name = f'foodgram_{key}'
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for endpoint, metrics in sorted(values.items()):
+                lines.append(
+                    f'{name}{{endpoint="{endpoint}"}} '
+                    f'{metrics.get(key, 0):g}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
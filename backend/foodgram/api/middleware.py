@@ -0,0 +1,33 @@
+from time import perf_counter
+
+from django.db import connection
+
+from .metrics import RequestMetrics, registry
+
+
+class RequestMetricsMiddleware:
+    """Считает SQL-запросы, время в базе, время сериализации и размер
+    ответа для каждого запроса.
+
+    Результат отдаётся клиенту в заголовке Server-Timing и
+    накапливается в api.metrics.registry. Эндпоинт задаёт MetricsMixin
+    в виде ViewSet.action, для остальных представлений используется имя
+    маршрута.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        with connection.execute_wrapper(metrics):
+            response = self.get_response(request)
+        duration = perf_counter() - metrics.started
+        if metrics.endpoint is None:
+            match = request.resolver_match
+            metrics.endpoint = match.view_name if match else 'unresolved'
+        size = 0 if response.streaming else len(response.content)
+        registry.record(metrics, duration, size)
+        response['Server-Timing'] = metrics.server_timing(duration)
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.3 on 2026-10-17 07:03
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, storage=api.storage.ContentAddressedStorage(), upload_to='api/images/recipes/', verbose_name='Картинка'),
+        ),
+    ]
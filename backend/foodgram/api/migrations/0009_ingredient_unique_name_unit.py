@@ -0,0 +1,50 @@
+# Generated by Django 4.0.3 on 2026-10-17 07:04
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    Ingredient = apps.get_model('api', 'Ingredient')
+    IngredientInRecipe = apps.get_model('api', 'IngredientInRecipe')
+    groups = Ingredient.objects.values(
+        'name',
+        'measurement_unit',
+    ).annotate(
+        keep_id=Min('id'),
+        total=Count('id'),
+    ).filter(total__gt=1)
+    for group in groups:
+        duplicates = Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit'],
+        ).exclude(id=group['keep_id'])
+        rows = IngredientInRecipe.objects.filter(ingredient__in=duplicates)
+        for row in rows:
+            kept = IngredientInRecipe.objects.filter(
+                recipe_id=row.recipe_id,
+                ingredient_id=group['keep_id'],
+            ).first()
+            if kept is None:
+                row.ingredient_id = group['keep_id']
+                row.save(update_fields=['ingredient'])
+            else:
+                kept.amount += row.amount
+                kept.save(update_fields=['amount'])
+                row.delete()
+        duplicates.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_recipe_image_content_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_measurement_unit'),
+        ),
+    ]
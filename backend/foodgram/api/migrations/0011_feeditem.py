@@ -0,0 +1,70 @@
+# Generated by Django 4.0.3 on 2026-10-17 07:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def backfill_feed(apps, schema_editor):
+    FeedItem = apps.get_model('api', 'FeedItem')
+    Subscription = apps.get_model('api', 'Subscription')
+    rows = Subscription.objects.filter(
+        subscriptions__recipes__isnull=False,
+    ).values_list(
+        'user_id',
+        'subscriptions__recipes__id',
+        'subscriptions_id',
+        'subscriptions__recipes__pub_date',
+    ).order_by()
+    batch = []
+    for user_id, recipe_id, author_id, pub_date in rows.iterator(BATCH_SIZE):
+        batch.append(FeedItem(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        ))
+        if len(batch) == BATCH_SIZE:
+            FeedItem.objects.bulk_create(batch)
+            batch = []
+    FeedItem.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0010_composite_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='api.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to=settings.AUTH_USER_MODEL, verbose_name='Владелец ленты')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-pub_date', '-id'], name='feed_item_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', 'author'], name='feed_item_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_item_user_recipe'),
+        ),
+        migrations.RunPython(backfill_feed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.0.3 on 2026-10-17 07:25
+
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+
+EXTENSIONS = {
+    'WEBP': '.webp',
+    'JPEG': '.jpg',
+}
+
+
+def thumbnail_name(name, size):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}_{size}{EXTENSIONS[settings.THUMBNAIL_FORMAT]}'
+
+
+def mark_existing_thumbnails(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    storage = Recipe._meta.get_field('image').storage
+    names = Recipe.objects.exclude(image='').values_list(
+        'image',
+        flat=True,
+    ).order_by().distinct()
+    ready = [
+        name for name in names
+        if all(
+            storage.exists(thumbnail_name(name, size))
+            for size in settings.THUMBNAIL_SIZES
+        )
+    ]
+    Recipe.objects.filter(image__in=ready).update(thumbnails_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_feeditem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnails_ready',
+            field=models.BooleanField(default=False, verbose_name='Уменьшенные копии картинки созданы'),
+        ),
+        migrations.RunPython(
+            mark_existing_thumbnails,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """Примесь для условных GET-запросов.
+
+    Ответ получает заголовки ETag и Last-Modified, построенные по
+    дешёвой метке версии данных. Если клиент прислал совпадающий
+    If-None-Match или If-Modified-Since, возвращается 304 без вызова
+    сериализатора.
+    """
+
+    conditional_vary = ()
+
+    def respond_conditionally(self, request, etag, last_modified,
+                              get_response):
+        etag = quote_etag(etag)
+        timestamp = None
+        if last_modified is not None:
+            timestamp = int(last_modified.timestamp())
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=timestamp,
+        )
+        if response is None:
+            response = get_response()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        if self.conditional_vary:
+            patch_vary_headers(response, self.conditional_vary)
+        return response
+
+
+class MetricsMixin:
+    """Примесь для наборов представлений, которая подписывает метрики
+    запроса именем ViewSet.action и учитывает время сериализаторов.
+
+    Работает только вместе с api.middleware.RequestMetricsMiddleware.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        metrics = getattr(request._request, 'metrics', None)
+        if metrics is not None:
+            metrics.endpoint = f'{type(self).__name__}.{self.action}'
+        super().initial(request, *args, **kwargs)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        metrics = getattr(self.request._request, 'metrics', None)
+        if metrics is not None:
+            serializer.to_representation = metrics.timed(
+                serializer.to_representation,
+            )
+        return serializer
@@ -1,5 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.functions import RowNumber
+
+from .storage import image_storage
 
 User = get_user_model()
 
@@ -20,6 +23,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_measurement_unit',
+            )
+        ]
 
     def __str__(self):
         """Возвращает строковое представление модели Ingredient
@@ -59,6 +68,100 @@ class Tag(models.Model):
         return f'{self.name}'
 
 
+class CatalogVersion(models.Model):
+    """Модель для хранения версий справочников тэгов и ингредиентов,
+    общих для всех процессов приложения
+    """
+
+    name = models.CharField(
+        max_length=50,
+        primary_key=True,
+        verbose_name='Справочник',
+    )
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Версия',
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        """Возвращает строковое представление модели CatalogVersion
+        """
+
+        return f'{self.name}: {self.version}'
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для модели Recipe
+    """
+
+    def with_list_relations(self):
+        """Подгружает автора, тэги и ингредиенты рецептов фиксированным
+        числом запросов, независимо от количества рецептов
+        """
+
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredientinrecipe_set',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient',
+                ),
+            ),
+        )
+
+    def top_by_author(self, limit):
+        """Возвращает не более limit последних рецептов каждого автора
+        одним запросом с оконной функцией ROW_NUMBER()
+        """
+
+        ranked = self.order_by().annotate(author_rank=models.Window(
+            expression=RowNumber(),
+            partition_by=[models.F('author')],
+            order_by=[models.F('pub_date').desc(), models.F('pk').desc()],
+        ))
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE author_rank <= %s '
+            f'ORDER BY author_id, author_rank',
+            (*params, limit),
+        )
+
+    def with_user_flags(self, user):
+        """Добавляет к рецептам признаки is_favorited, is_in_shopping_cart
+        и author_is_subscribed для пользователя user, чтобы сериализаторы
+        не выполняли отдельный запрос для каждого рецепта
+        """
+
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+                author_is_subscribed=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user,
+                recipe=models.OuterRef('pk'),
+            )),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user,
+                recipe=models.OuterRef('pk'),
+            )),
+            author_is_subscribed=models.Exists(Subscription.objects.filter(
+                user=user,
+                subscriptions=models.OuterRef('author'),
+            )),
+        )
+
+
 class Recipe(models.Model):
     """Модель для управления рецептами
     """
@@ -67,6 +170,7 @@ class Recipe(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
+        db_index=False,
         verbose_name='Автор рецепта',
     )
     name = models.CharField(
@@ -75,6 +179,8 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='api/images/recipes/',
+        storage=image_storage,
+        db_index=True,
         verbose_name='Картинка',
     )
     text = models.TextField(
@@ -98,11 +204,39 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество добавлений в избранное',
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество добавлений в список покупок',
+    )
+    thumbnails_ready = models.BooleanField(
+        default=False,
+        verbose_name='Уменьшенные копии картинки созданы',
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         """Возвращает строковое представление модели Recipe
@@ -124,6 +258,7 @@ class IngredientInRecipe(models.Model):
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Рецепт',
     )
     amount = models.PositiveIntegerField(
@@ -140,6 +275,12 @@ class IngredientInRecipe(models.Model):
                 name='unique_name_ingredient_in_recipe',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient'],
+                name='ingredient_in_recipe_idx',
+            ),
+        ]
 
     def __str__(self):
         """Возвращает строковое представление модели IngredientInRecipe
@@ -162,6 +303,7 @@ class Subscription(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='subscribed_to',
+        db_index=False,
         verbose_name='Пользователь, на которого подписываются',
     )
 
@@ -175,6 +317,16 @@ class Subscription(models.Model):
                 name='unique_name_subscriptions',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['subscriptions', 'user'],
+                name='subscription_author_user_idx',
+            ),
+            models.Index(
+                fields=['user', '-id'],
+                name='subscription_user_id_idx',
+            ),
+        ]
 
     def __str__(self):
         """Возвращает строковое представление модели Subscription
@@ -197,6 +349,7 @@ class ShoppingCart(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='in_shopping_cart',
+        db_index=False,
         verbose_name='Рецепты, добавленные в список покупок',
     )
 
@@ -210,6 +363,12 @@ class ShoppingCart(models.Model):
                 name='unique_name_recipe_in_shopping_cart',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='shopping_cart_recipe_user_idx',
+            ),
+        ]
 
     def __str__(self):
         """Возвращает строковое представление модели ShoppingCart
@@ -232,6 +391,7 @@ class Favorite(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='in_favorites',
+        db_index=False,
         verbose_name='Рецепт, который добавляется в избранное',
     )
 
@@ -245,6 +405,12 @@ class Favorite(models.Model):
                 name='unique_name_recipe_in_favorites',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='favorite_recipe_user_idx',
+            ),
+        ]
 
     def __str__(self):
         """Возвращает строковое представление модели Favorite
@@ -252,3 +418,60 @@ class Favorite(models.Model):
 
         return (f'Рецепты, добавленные в избранное пользователем '
                 f'{self.user.username}')
+
+
+class FeedItem(models.Model):
+    """Модель для ленты рецептов авторов, на которых подписан
+    пользователь. Записи создаются при публикации рецепта и при
+    подписке, поэтому лента читается без соединения с подписками
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        db_index=False,
+        verbose_name='Владелец ленты',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item_user_recipe',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-id'],
+                name='feed_item_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_item_user_author_idx',
+            ),
+        ]
+
+    def __str__(self):
+        """Возвращает строковое представление модели FeedItem
+        """
+
+        return f'Лента пользователя {self.user_id}: рецепт {self.recipe_id}'
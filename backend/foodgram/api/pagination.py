@@ -1,6 +1,141 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу сортировки: вместо OFFSET следующая страница
+    начинается сразу после последней записи предыдущей
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(
+                self.ordering,
+                position,
+            ))
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def get_seek_filter(self, ordering, position):
+        """Строит условие (a, b) < (x, y) в виде
+        a <= x AND (a < x OR b < y), которое использует составной индекс
+        """
+
+        field, descending = ordering[0].lstrip('-'), ordering[0][0] == '-'
+        value = position[0]
+        lookup = 'lt' if descending else 'gt'
+        after = Q(**{f'{field}__{lookup}': value})
+        if len(ordering) == 1:
+            return after
+        return Q(**{f'{field}__{lookup}e': value}) & (
+            after | self.get_seek_filter(ordering[1:], position[1:])
+        )
+
+    def get_ordering_field(self, queryset, name):
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def decode_cursor(self, request, queryset):
+        """Возвращает позицию из курсора, приведённую к типам полей
+        сортировки. Испорченный курсор приводит к ответу 404
+        """
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded))
+            if (not isinstance(position, list)
+                    or len(position) != len(self.ordering)):
+                raise ValueError
+            position = [
+                self.get_ordering_field(
+                    queryset,
+                    field.lstrip('-'),
+                ).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+            if None in position:
+                raise ValueError
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, obj):
+        position = [
+            getattr(obj, field.lstrip('-')) for field in self.ordering
+        ]
+        data = json.dumps(position, default=str)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1]),
+        )
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['results'] = data
+        return Response(response)
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (self.cursor_query_param in request.query_params
+                or getattr(view, 'pagination_mode', None) == 'cursor'):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,166 @@
+import re
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from .models import (Favorite, FeedItem, IngredientInRecipe, Recipe,
+                     ShoppingCart, Subscription)
+from .search import prefix_matches, substring_matches
+
+FULL_SCAN = {
+    'sqlite': r'SCAN {table}(?! USING)',
+    'postgresql': r'Seq Scan on {table}\b',
+}
+SORT = {
+    'sqlite': r'USE TEMP B-TREE FOR ORDER BY',
+    'postgresql': r'\bSort\b',
+}
+
+
+def hot_queries(user_id, recipe_id, tag_id):
+    """Возвращает горячие запросы приложения, таблицы, которые они
+    должны читать по индексу, и признак того, что порядок строк тоже
+    должен браться из индекса
+    """
+
+    tags = Recipe.tags.through
+    return [
+        (
+            'recipe feed',
+            Recipe.objects.order_by('-pub_date', '-id')[:6],
+            ['api_recipe'],
+            True,
+        ),
+        (
+            'recipes of author',
+            Recipe.objects.filter(author=user_id).order_by(
+                '-pub_date', '-id',
+            )[:6],
+            ['api_recipe'],
+            True,
+        ),
+        (
+            'recipes by tag',
+            tags.objects.filter(tag_id__in=[tag_id]).values('recipe_id'),
+            [tags._meta.db_table],
+            False,
+        ),
+        (
+            'favorites of user',
+            Favorite.objects.filter(user=user_id).values('recipe'),
+            ['api_favorite'],
+            False,
+        ),
+        (
+            'is_favorited',
+            Favorite.objects.filter(user=user_id, recipe=recipe_id),
+            ['api_favorite'],
+            False,
+        ),
+        (
+            'is_in_shopping_cart',
+            ShoppingCart.objects.filter(user=user_id, recipe=recipe_id),
+            ['api_shoppingcart'],
+            False,
+        ),
+        (
+            'recipe favorites count',
+            Favorite.objects.filter(recipe=recipe_id).values('user'),
+            ['api_favorite'],
+            False,
+        ),
+        (
+            'is_subscribed',
+            Subscription.objects.filter(
+                user=user_id,
+                subscriptions=user_id,
+            ),
+            ['api_subscription'],
+            False,
+        ),
+        (
+            'subscriptions page',
+            Subscription.objects.filter(user=user_id).order_by('-id')[:6],
+            ['api_subscription'],
+            True,
+        ),
+        (
+            'subscribers of author',
+            Subscription.objects.filter(subscriptions=user_id).values('user'),
+            ['api_subscription'],
+            False,
+        ),
+        (
+            'home feed page',
+            FeedItem.objects.filter(user=user_id).order_by(
+                '-pub_date', '-id',
+            )[:6],
+            ['api_feeditem'],
+            True,
+        ),
+        (
+            'unfollow feed cleanup',
+            FeedItem.objects.filter(user=user_id, author__in=[user_id]),
+            ['api_feeditem'],
+            False,
+        ),
+        (
+            'recipe ingredients',
+            IngredientInRecipe.objects.filter(recipe__in=[recipe_id]),
+            ['api_ingredientinrecipe'],
+            False,
+        ),
+    ]
+
+
+def postgresql_queries():
+    """Возвращает запросы, индексы для которых создаются только в
+    PostgreSQL, см. миграцию 0005
+    """
+
+    limit = settings.INGREDIENT_SEARCH_LIMIT
+    return [
+        (
+            'ingredient prefix search',
+            prefix_matches('с')[:limit],
+            ['api_ingredient'],
+            False,
+        ),
+        (
+            'ingredient substring search',
+            substring_matches('сах')[:limit],
+            ['api_ingredient'],
+            False,
+        ),
+    ]
+
+
+@contextmanager
+def prefer_indexes():
+    """Запрещает PostgreSQL последовательное чтение до конца текущей
+    транзакции.
+
+    На маленьких таблицах планировщик предпочитает последовательное
+    чтение, даже если индекс подходит.
+    """
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    yield
+
+
+def plan_problems(queryset, tables, ordered):
+    """Возвращает план запроса и список его проблем: полных чтений
+    таблиц tables и, если ordered, сортировки вне индекса
+    """
+
+    plan = queryset.explain()
+    problems = [
+        f'full scan of {table}' for table in tables
+        if re.search(FULL_SCAN[connection.vendor].format(table=table), plan)
+    ]
+    if ordered and re.search(SORT[connection.vendor], plan):
+        problems.append('sort outside of index')
+    return plan, problems
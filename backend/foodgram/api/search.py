@@ -0,0 +1,89 @@
+from bisect import bisect_left
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import ingredient_catalog
+from .models import Ingredient
+
+
+def prefix_matches(value):
+    """Ингредиенты, название которых начинается с value.
+
+    Читает диапазон индекса ingredient_name_prefix_idx, поэтому
+    работает и для запросов из одной-двух букв, для которых не
+    подходит индекс по триграммам.
+    """
+
+    return Ingredient.objects.filter(name__istartswith=value).order_by('name')
+
+
+def substring_matches(value):
+    """Ингредиенты, название которых содержит value не с начала
+    """
+
+    return Ingredient.objects.filter(name__icontains=value).exclude(
+        name__istartswith=value,
+    ).order_by('name')
+
+
+class IngredientAutocomplete:
+    """Поиск ингредиентов по началу названия для автодополнения.
+
+    Сначала выдаются совпадения по началу названия без учёта регистра,
+    затем совпадения по подстроке. На PostgreSQL поиск выполняется
+    в базе двумя запросами по индексам из миграции api.0005, на
+    остальных базах - по отсортированному массиву названий, который
+    строится из кэша справочника ингредиентов и перестраивается при
+    смене его версии.
+    """
+
+    def __init__(self):
+        self.index = None
+
+    def search(self, value, limit=None):
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        if connection.vendor == 'postgresql':
+            return self.search_in_db(value, limit)
+        return self.search_in_memory(value.lower(), limit)
+
+    def search_in_db(self, value, limit):
+        result = list(prefix_matches(value)[:limit])
+        if len(result) < limit:
+            result += substring_matches(value)[:limit - len(result)]
+        return result
+
+    def search_in_memory(self, value, limit):
+        entries, keys = self.get_index()
+        start = bisect_left(keys, value)
+        result = []
+        for key, ingredient in entries[start:]:
+            if len(result) == limit or not key.startswith(value):
+                break
+            result.append(ingredient)
+        for key, ingredient in entries:
+            if len(result) == limit:
+                break
+            if key.find(value) > 0:
+                result.append(ingredient)
+        return result
+
+    def get_index(self):
+        snapshot = ingredient_catalog.get()
+        index = self.index
+        if index is None or index[0] != snapshot.version:
+            entries = sorted(
+                (
+                    (ingredient.name.lower(), ingredient)
+                    for ingredient in snapshot.objects
+                ),
+                key=itemgetter(0),
+            )
+            index = (snapshot.version, entries, [key for key, _ in entries])
+            self.index = index
+        return index[1], index[2]
+
+
+ingredient_autocomplete = IngredientAutocomplete()
@@ -1,8 +1,13 @@
+import json
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 
+from .cache import ingredient_catalog, tag_catalog
+from .fields import StreamingImageField, ThumbnailField
 from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                      ShoppingCart, Subscription, Tag)
 
@@ -22,6 +27,8 @@ class CustomUserSerializer(serializers.ModelSerializer):
         extra_kwargs = {"password": {'write_only': True}}
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -69,19 +76,28 @@ class IngredientInRecipeCreateUpdateSerializer(serializers.Serializer):
     ingredient.id, amount
     """
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = IngredientInRecipe
         fields = ('id', 'amount',)
 
+    def validate_id(self, value):
+        if value not in ingredient_catalog.get().ids:
+            raise serializers.ValidationError(
+                f'Ингредиента с id {value} не существует'
+            )
+        return value
+
 
 class RecipeListSerializer(serializers.ModelSerializer):
     """Сериализатор для вывода данных объектов модели Recipe
     """
 
     image = Base64ImageField()
+    image_small = ThumbnailField('small')
+    image_medium = ThumbnailField('medium')
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(many=True)
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -94,10 +110,17 @@ class RecipeListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time',)
+                  'is_in_shopping_cart', 'name', 'image', 'image_small',
+                  'image_medium', 'text', 'cooking_time',)
+
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -107,6 +130,8 @@ class RecipeListSerializer(serializers.ModelSerializer):
             recipe=obj).exists()
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -115,14 +140,16 @@ class RecipeListSerializer(serializers.ModelSerializer):
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
-    """Сериализатор для создания и обновления объектов модели Recipe
+    """Сериализатор для создания и обновления объектов модели Recipe.
+
+    Принимает JSON с картинкой в base64 или multipart-запрос с файлом
+    картинки, списком tags и ingredients в виде JSON-строки.
     """
 
-    image = Base64ImageField()
+    image = StreamingImageField()
     author = CustomUserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all(),
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
     )
     ingredients = IngredientInRecipeCreateUpdateSerializer(
         many=True,
@@ -132,20 +159,102 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('tags', 'author', 'ingredients',
                   'name', 'image', 'text', 'cooking_time',)
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            data = self.parse_multipart(data)
+        return super().to_internal_value(data)
+
+    def parse_multipart(self, data):
+        parsed = {key: data[key] for key in data}
+        if 'tags' in data:
+            parsed['tags'] = data.getlist('tags')
+        ingredients = parsed.get('ingredients')
+        if isinstance(ingredients, str):
+            try:
+                parsed['ingredients'] = json.loads(ingredients)
+            except ValueError:
+                raise serializers.ValidationError({
+                    'ingredients': 'Ожидается список ингредиентов в JSON'
+                })
+        return parsed
+
+    def validate_tags(self, value):
+        tags = tag_catalog.get().ids
+        for tag_id in value:
+            if tag_id not in tags:
+                raise serializers.ValidationError(
+                    f'Тэга с id {tag_id} не существует'
+                )
+        return value
+
+    def validate_ingredients(self, value):
+        ingredients = [data['id'] for data in value]
+        if len(ingredients) != len(set(ingredients)):
+            raise serializers.ValidationError(
+                'Ингредиенты в рецепте не должны повторяться'
+            )
+        return value
     
     def to_representation(self, instance):
-        serializer = RecipeListSerializer(instance)
+        request = self.context.get('request')
+        recipes = Recipe.objects.with_list_relations()
+        if request is not None:
+            recipes = recipes.with_user_flags(request.user)
+        serializer = RecipeListSerializer(
+            recipes.get(pk=instance.pk),
+            context=self.context,
+        )
         return serializer.data
 
     def add_data_to_recipe(self, recipe, tags_data, ingredients_data):
-        for tag in tags_data:
-            recipe.tags.add(tag)
-        for data in ingredients_data:
-            IngredientInRecipe.objects.get_or_create(
-                ingredient=data['id'],
+        recipe.tags.set(tags_data)
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                ingredient_id=data['id'],
                 recipe=recipe,
                 amount=data['amount'],
             )
+            for data in ingredients_data
+        ])
+
+    def sync_ingredients(self, recipe, ingredients_data):
+        amounts = {data['id']: data['amount'] for data in ingredients_data}
+        existing = {
+            row.ingredient_id: row
+            for row in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed,
+            ).delete()
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                ingredient_id=ingredient_id,
+                recipe=recipe,
+                amount=amount,
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ])
 
     def create(self, validated_data):
         tags_data = validated_data.pop('tags')
@@ -155,37 +264,41 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         text = validated_data.get('text')
         cooking_time = validated_data.get('cooking_time')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(
-            author = author,
-            name=name,
-            image=image,
-            text=text,
-            cooking_time=cooking_time,
-        )
-        self.add_data_to_recipe(recipe, tags_data, ingredients)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                author=author,
+                name=name,
+                image=image,
+                text=text,
+                cooking_time=cooking_time,
+            )
+            self.add_data_to_recipe(recipe, tags_data, ingredients)
         return recipe
 
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
-        super().update(instance, validated_data)
-        ingredients_for_delete = IngredientInRecipe.objects.filter(
-                recipe=instance,
-            )
-        ingredients_for_delete.delete()
-        instance.tags.clear()
-        self.add_data_to_recipe(instance, tags_data, ingredients_data)
+        ingredients_data = validated_data.pop('ingredients', None)
+        tags_data = validated_data.pop('tags', None)
+        with transaction.atomic():
+            super().update(instance, validated_data)
+            if tags_data is not None:
+                instance.tags.set(tags_data)
+            if ingredients_data is not None:
+                self.sync_ingredients(instance, ingredients_data)
         return instance
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Recipe, работающий с полями 'id', 'name',
-    'image', 'cooking_time'
+    'image', 'image_small', 'image_medium', 'cooking_time'
     """
 
+    image_small = ThumbnailField('small')
+    image_medium = ThumbnailField('medium')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'image_small', 'image_medium',
+                  'cooking_time',)
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -223,10 +336,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return serializer.data
 
     def get_recipes_count(self, obj):
-        user_id = self.context['view'].kwargs.get('id')
-        user = get_object_or_404(User, pk=user_id)
-        recipes_count = user.recipes.count()
-        return recipes_count
+        return obj.recipes_count
 
 
 class SubscriptionListSerializer(serializers.ModelSerializer):
@@ -243,6 +353,8 @@ class SubscriptionListSerializer(serializers.ModelSerializer):
                   'is_subscribed', 'recipes', 'recipes_count',)
     
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -252,6 +364,11 @@ class SubscriptionListSerializer(serializers.ModelSerializer):
             subscriptions=obj).exists()
 
     def get_recipes(self, obj):
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.pk, [])
+            serializer = RecipeMinifiedSerializer(recipes, many=True)
+            return serializer.data
         request = self.context['request']
         query_params = request.query_params.get('recipes_limit')
         recipes_count = Recipe.objects.filter(author=obj).count()
@@ -264,5 +381,32 @@ class SubscriptionListSerializer(serializers.ModelSerializer):
         return serializer.data
 
     def get_recipes_count(self, obj):
-        recipes_count = obj.recipes.count()
-        return recipes_count
+        return obj.recipes_count
+
+
+class BatchToggleSerializer(serializers.Serializer):
+    """Сериализатор для пакетного добавления и удаления связей
+    пользователя с рецептами или авторами
+    """
+
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=settings.BATCH_TOGGLE_MAX_ITEMS,
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=settings.BATCH_TOGGLE_MAX_ITEMS,
+    )
+
+    def validate(self, data):
+        add = list(dict.fromkeys(data['add']))
+        remove = list(dict.fromkeys(data['remove']))
+        both = set(add) & set(remove)
+        if both:
+            raise serializers.ValidationError(
+                'Нельзя одновременно добавить и удалить id '
+                f'{", ".join(map(str, sorted(both)))}'
+            )
+        return {'add': add, 'remove': remove}
@@ -0,0 +1,145 @@
+import csv
+import os
+from hashlib import md5
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .cache import ingredient_catalog
+from .models import IngredientInRecipe, Recipe
+from .units import BASE_UNIT, UNIT_FACTOR
+
+# Встроенные шрифты PDF не содержат кириллицы, поэтому шрифт
+# DejaVu Sans поставляется вместе с приложением
+PDF_FONT = 'DejaVuSans'
+PDF_FONT_SIZE = 12
+PDF_TITLE_SIZE = 16
+PDF_MARGIN = 20 * mm
+PDF_LINE_HEIGHT = 7 * mm
+
+pdfmetrics.registerFont(TTFont(
+    PDF_FONT,
+    os.path.join(os.path.dirname(__file__), 'fonts', 'DejaVuSans.ttf'),
+))
+
+
+class Echo:
+    """Буфер для csv.writer, который возвращает записанную строку
+    вместо того, чтобы её хранить
+    """
+
+    def write(self, value):
+        return value
+
+
+def get_cart_version(user):
+    """Возвращает метку состояния списка покупок пользователя.
+
+    Метка меняется при добавлении и удалении рецептов из списка покупок,
+    при изменении рецептов из списка и справочника ингредиентов, поэтому
+    агрегированный список не нужно явно удалять из кэша.
+    """
+
+    state = Recipe.objects.filter(in_shopping_cart__user=user).aggregate(
+        recipes=Count('id'),
+        last_added=Max('in_shopping_cart__id'),
+        updated_at=Max('updated_at'),
+    )
+    return md5(repr((
+        state['recipes'],
+        state['last_added'],
+        state['updated_at'],
+        ingredient_catalog.get().version,
+    )).encode()).hexdigest()
+
+
+def aggregate_shopping_cart(user):
+    """Суммирует ингредиенты из списка покупок в базе данных, приводя
+    количества к базовым единицам измерения из api.units
+    """
+
+    items = IngredientInRecipe.objects.filter(
+        recipe__in_shopping_cart__user=user,
+    ).annotate(
+        unit=BASE_UNIT,
+    ).values(
+        'ingredient__name',
+        'unit',
+    ).annotate(
+        total=Sum(F('amount') * UNIT_FACTOR),
+    ).order_by('-total')
+    return [
+        (item['ingredient__name'], item['unit'], item['total'])
+        for item in items
+    ]
+
+
+def get_shopping_cart(user):
+    """Возвращает список покупок пользователя в виде кортежей
+    (название, единица измерения, количество), кэшируя агрегацию
+    до изменения списка
+    """
+
+    key = f'shopping_cart:{user.pk}:{get_cart_version(user)}'
+    items = cache.get(key)
+    if items is None:
+        items = aggregate_shopping_cart(user)
+        cache.set(key, items, settings.SHOPPING_CART_CACHE_TIMEOUT)
+    return items
+
+
+def format_item(name, measurement_unit, total):
+    return f'{name} ({measurement_unit}) - {total}'
+
+
+def render_txt(items):
+    for item in items:
+        yield format_item(*item) + '\n'
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for item in items:
+        yield writer.writerow(item)
+
+
+def render_pdf(items):
+    """Рисует список покупок на страницах A4 и отдаёт готовый файл.
+
+    PDF ссылается на страницы по смещениям в файле, поэтому документ
+    собирается целиком перед отправкой. Его размер ограничен числом
+    строк списка, которое мало после агрегации по ингредиентам.
+    """
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle('Список покупок')
+    width, height = A4
+    pdf.setFont(PDF_FONT, PDF_TITLE_SIZE)
+    pdf.drawString(PDF_MARGIN, height - PDF_MARGIN, 'Список покупок')
+    pdf.setFont(PDF_FONT, PDF_FONT_SIZE)
+    y = height - PDF_MARGIN - 2 * PDF_LINE_HEIGHT
+    for item in items:
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(PDF_FONT, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        pdf.drawString(PDF_MARGIN, y, format_item(*item))
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+    yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .cache import ingredient_catalog, tag_catalog
+from .feed import fan_out_recipe
+from .models import Ingredient, Recipe, Tag
+from .storage import image_storage
+from .thumbnails import delete_thumbnails, schedule_thumbnails
+
+User = get_user_model()
+
+
+def delete_unused_image(name):
+    """Удаляет картинку и её уменьшенные копии, если на картинку
+    больше не ссылается ни один рецепт.
+
+    Хранилище рецептов складывает одинаковые картинки в один файл,
+    поэтому число ссылок на файл определяется запросом к Recipe.
+    """
+
+    return image_storage.release(
+        name,
+        Recipe.objects.filter(image=name).exists,
+        delete_thumbnails,
+    )
+
+
+def release_image(name):
+    if name:
+        transaction.on_commit(lambda: delete_unused_image(name))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tag_catalog(sender, **kwargs):
+    tag_catalog.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_catalog(sender, **kwargs):
+    ingredient_catalog.invalidate()
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_image(sender, instance, **kwargs):
+    instance.previous_image = None
+    if instance.pk is not None:
+        instance.previous_image = Recipe.objects.filter(
+            pk=instance.pk,
+        ).values_list('image', flat=True).first()
+    if instance.previous_image != instance.image.name:
+        instance.thumbnails_ready = False
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_thumbnails(sender, instance, **kwargs):
+    schedule_thumbnails(instance.image.name)
+    if instance.previous_image != instance.image.name:
+        release_image(instance.previous_image)
+
+
+@receiver(post_save, sender=Recipe)
+def add_recipe_to_feeds(sender, instance, created, **kwargs):
+    if created:
+        fan_out_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    release_image(instance.image.name)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    token_cache.invalidate(*Token.objects.filter(
+        user=instance,
+    ).values_list('key', flat=True))
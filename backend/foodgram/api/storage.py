@@ -0,0 +1,101 @@
+import fcntl
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+# Блокировки делятся между именами файлов, чтобы не создавать
+# отдельный файл блокировки для каждой картинки
+LOCK_STRIPES = 64
+LOCK_DIRECTORY = '.locks'
+
+
+def content_hash(content):
+    """Возвращает sha256 содержимого файла, читая его кусками
+    """
+
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(name, digest):
+    """Возвращает имя файла в той же папке, построенное по хэшу
+    содержимого digest и расширению исходного имени name
+    """
+
+    directory, filename = os.path.split(name)
+    _, extension = os.path.splitext(filename)
+    return os.path.join(directory, f'{digest}{extension.lower()}')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, в котором имя файла задаётся хэшем его
+    содержимого.
+
+    Одинаковые картинки сохраняются один раз, а повторная загрузка
+    возвращает имя уже сохранённого файла. Файл удаляется, когда на
+    него не ссылается ни один рецепт, см. api.signals.
+    """
+
+    @contextmanager
+    def lock(self, name):
+        """Блокирует имя name между процессами на время сохранения или
+        удаления файла
+        """
+
+        directory = self.path(LOCK_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        stripe = int(hashlib.md5(name.encode()).hexdigest(), 16)
+        path = os.path.join(directory, f'{stripe % LOCK_STRIPES}.lock')
+        with open(path, 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _save(self, name, content):
+        name = content_name(name, content_hash(content))
+        with self.lock(name):
+            if self.exists(name):
+                # Время изменения отмечает повторное использование файла
+                # рецептом, который ещё не зафиксирован в базе
+                os.utime(self.path(name))
+                return name
+            return super()._save(name, content)
+
+    def release(self, name, is_referenced, on_delete=None):
+        """Удаляет файл name, если is_referenced() ложно и файл не
+        сохраняли повторно за последние IMAGE_RELEASE_GRACE секунд.
+
+        Проверка и удаление выполняются под той же блокировкой, что и
+        сохранение, поэтому одновременная загрузка такой же картинки
+        либо продлевает жизнь файла, либо записывает его заново.
+        Возвращает True, если файл удалён.
+        """
+
+        with self.lock(name):
+            if not self.exists(name) or is_referenced():
+                return False
+            age = time.time() - os.path.getmtime(self.path(name))
+            if age < settings.IMAGE_RELEASE_GRACE:
+                return False
+            self.delete(name)
+            if on_delete is not None:
+                on_delete(name)
+        return True
+
+
+image_storage = ContentAddressedStorage()
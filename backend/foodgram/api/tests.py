@@ -0,0 +1,934 @@
+import base64
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import TokenCache, token_cache
+from .cache import ingredient_catalog
+from .models import (Favorite, FeedItem, Ingredient, IngredientInRecipe,
+                     Recipe, ShoppingCart, Subscription, Tag)
+from .query_plans import (FULL_SCAN, hot_queries, plan_problems,
+                          postgresql_queries, prefer_indexes)
+from .search import ingredient_autocomplete
+from .signals import delete_unused_image
+from .storage import image_storage
+from .thumbnails import make_thumbnails, make_thumbnails_safely, thumbnail_name
+
+User = get_user_model()
+
+
+def use_temporary_media(test):
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root)
+    settings_override = override_settings(MEDIA_ROOT=media_root)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+
+
+def jpeg(color='#49B64E'):
+    buffer = BytesIO()
+    Image.new('RGB', (800, 600), color).save(buffer, 'JPEG')
+    return ContentFile(buffer.getvalue(), name='photo.jpg')
+
+
+def create_recipes(author, count, tags, ingredients):
+    Recipe.objects.bulk_create([
+        Recipe(
+            author=author,
+            name=f'Рецепт {number}',
+            image=f'api/images/recipes/{number}.jpg',
+            text='Описание',
+            cooking_time=10,
+        )
+        for number in range(count)
+    ])
+    recipes = list(Recipe.objects.filter(author=author))
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe=recipe, tag=tag)
+        for recipe in recipes
+        for tag in tags
+    ])
+    IngredientInRecipe.objects.bulk_create([
+        IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+        for recipe in recipes
+        for ingredient in ingredients
+    ])
+    return recipes
+
+
+class TokenCacheTest(TestCase):
+    """Отзыв токена в одном воркере сразу виден в остальных
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+        )
+        self.key = 'a' * 40
+        self.first, self.second = TokenCache(), TokenCache()
+
+    @override_settings(TOKEN_CACHE_SHARED=True)
+    def test_invalidation_reaches_other_workers(self):
+        self.first.set(self.key, self.user)
+        self.assertEqual(self.second.get(self.key), self.user)
+        self.first.invalidate(self.key)
+        self.assertIsNone(self.second.get(self.key))
+        self.assertIsNone(self.first.get(self.key))
+
+    @override_settings(TOKEN_CACHE_SHARED=True)
+    def test_revoked_token_is_not_cached_again(self):
+        self.first.invalidate(self.key)
+        self.second.set(self.key, self.user)
+        self.assertIsNone(self.second.get(self.key))
+
+    @override_settings(TOKEN_CACHE_SHARED=False)
+    def test_local_cache_without_shared_cache(self):
+        self.first.set(self.key, self.user)
+        self.assertEqual(self.first.get(self.key), self.user)
+        self.assertIsNone(self.second.get(self.key))
+        self.first.invalidate(self.key)
+        self.assertIsNone(self.first.get(self.key))
+
+    @override_settings(TOKEN_CACHE_SHARED=False, TOKEN_CACHE_TTL=0)
+    def test_local_entry_expires(self):
+        self.first.set(self.key, self.user)
+        self.assertIsNone(self.first.get(self.key))
+
+    def test_cached_token_saves_a_query(self):
+        token = Token.objects.create(user=self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        for shared in (False, True):
+            with self.subTest(shared=shared), override_settings(
+                TOKEN_CACHE_SHARED=shared,
+            ):
+                cache.clear()
+                token_cache.forget(token.key)
+                with CaptureQueriesContext(connection) as miss:
+                    client.get('/api/users/me/')
+                with CaptureQueriesContext(connection) as hit:
+                    response = client.get('/api/users/me/')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(hit), len(miss) - 1)
+
+    @override_settings(TOKEN_CACHE_SHARED=True)
+    def test_logout_rejects_token(self):
+        token = Token.objects.create(user=self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        self.assertEqual(
+            client.post('/api/auth/token/logout/').status_code,
+            204,
+        )
+        self.assertEqual(client.get('/api/users/me/').status_code, 401)
+
+
+class RecipeListQueriesTest(TestCase):
+    """Количество запросов к базе на страницу списка рецептов не
+    зависит от размера страницы
+    """
+
+    # COUNT для пагинации, страница рецептов, тэги и ингредиенты
+    LIST_QUERIES = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        cls.reader = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+        )
+        tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('Завтрак', '#E26C2D', 'breakfast'),
+                ('Обед', '#49B64E', 'lunch'),
+            )
+        ]
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        ])
+        recipes = create_recipes(cls.author, 200, tags, ingredients)
+        Favorite.objects.bulk_create([
+            Favorite(user=cls.reader, recipe=recipe)
+            for recipe in recipes[::2]
+        ])
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=cls.reader, recipe=recipe)
+            for recipe in recipes[::3]
+        ])
+        Subscription.objects.create(
+            user=cls.reader,
+            subscriptions=cls.author,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch.object(FileSystemStorage, 'exists')
+    def test_list_does_not_touch_storage(self, exists):
+        APIClient().get('/api/recipes/?limit=50')
+        exists.assert_not_called()
+
+    def assert_fixed_queries(self, client):
+        # Первый запрос заполняет кэш справочника тэгов для фильтра
+        client.get('/api/recipes/?limit=1')
+        for limit in (6, 50, 200):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(self.LIST_QUERIES):
+                    response = client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous_list_queries(self):
+        self.assert_fixed_queries(APIClient())
+
+    def test_authenticated_list_queries(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.assert_fixed_queries(client)
+        results = client.get('/api/recipes/?limit=6').data['results']
+        self.assertTrue(all(
+            recipe['author']['is_subscribed'] for recipe in results
+        ))
+        self.assertTrue(any(recipe['is_favorited'] for recipe in results))
+        self.assertTrue(any(
+            recipe['is_in_shopping_cart'] for recipe in results
+        ))
+
+
+class KeysetPaginationTest(TestCase):
+    """Испорченный курсор возвращает 404, а не ошибку сервера
+    """
+
+    def encode(self, position):
+        data = json.dumps(position).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def test_invalid_cursor_values(self):
+        client = APIClient()
+        for position in (['zzz', 1], [{'a': 1}, 1], [None, 1],
+                         ['2022-01-01T00:00:00Z', 'x'], [1], 'cursor'):
+            with self.subTest(position=position):
+                response = client.get(
+                    f'/api/recipes/?cursor={self.encode(position)}'
+                )
+                self.assertEqual(response.status_code, 404)
+        response = client.get('/api/recipes/?cursor=%%%')
+        self.assertEqual(response.status_code, 404)
+        position = self.encode(['2022-01-01T00:00:00+00:00', 1])
+        response = client.get(f'/api/recipes/?cursor={position}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_subscriptions_cursor(self):
+        user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(
+            f'/api/users/subscriptions/?cursor={self.encode(["x"])}'
+        )
+        self.assertEqual(response.status_code, 404)
+        response = client.get(
+            f'/api/users/subscriptions/?cursor={self.encode([10])}'
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class IngredientSearchTest(TestCase):
+    """Поиск в базе выдаёт сначала совпадения по началу названия, затем
+    по подстроке, как и поиск в памяти
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create([
+            Ingredient(name=name, measurement_unit='г')
+            for name in (
+                'сахарная пудра', 'ванильный сахар', 'сахар',
+                'соль', 'тростниковый сахар', 'сахарин',
+            )
+        ])
+
+    def test_prefix_matches_come_first(self):
+        cache.clear()
+        for value, limit, expected in (
+            ('сах', 10, ['сахар', 'сахарин', 'сахарная пудра',
+                         'ванильный сахар', 'тростниковый сахар']),
+            ('сах', 4, ['сахар', 'сахарин', 'сахарная пудра',
+                        'ванильный сахар']),
+            ('с', 2, ['сахар', 'сахарин']),
+        ):
+            with self.subTest(value=value, limit=limit):
+                for search in (
+                    ingredient_autocomplete.search_in_db,
+                    ingredient_autocomplete.search_in_memory,
+                ):
+                    self.assertEqual(
+                        [
+                            ingredient.name
+                            for ingredient in search(value, limit)
+                        ],
+                        expected,
+                    )
+
+
+class BatchToggleTest(TestCase):
+    """Пакетное добавление и удаление возвращает статус каждого id и
+    пересчитывает счётчики
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        cls.reader = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+        )
+        cls.recipes = create_recipes(cls.author, 3, [], [])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def post(self, url, data, status_code=200):
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status_code, response.data)
+        return response.data
+
+    def statuses(self, data):
+        return {
+            (result['action'], result['id']): result['status']
+            for result in data['results']
+        }
+
+    def counts(self, counter):
+        counts = dict(Recipe.objects.values_list('pk', counter))
+        return [counts[recipe.pk] for recipe in self.recipes]
+
+    def test_favorite_and_shopping_cart(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        for path, model, counter in (
+            ('favorite', Favorite, 'favorites_count'),
+            ('shopping_cart', ShoppingCart, 'shopping_cart_count'),
+        ):
+            with self.subTest(path=path):
+                url = f'/api/recipes/{path}/batch/'
+                self.post(url, {'add': [second]})
+                data = self.post(url, {
+                    'add': [first, second, 999, first],
+                    'remove': [third],
+                })
+                self.assertEqual(self.statuses(data), {
+                    ('add', first): 'added',
+                    ('add', second): 'exists',
+                    ('add', 999): 'not_found',
+                    ('remove', third): 'missing',
+                })
+                self.assertEqual(self.counts(counter), [1, 1, 0])
+                data = self.post(url, {
+                    'add': [third],
+                    'remove': [first, second],
+                })
+                self.assertEqual(self.statuses(data), {
+                    ('add', third): 'added',
+                    ('remove', first): 'removed',
+                    ('remove', second): 'removed',
+                })
+                self.assertEqual(self.counts(counter), [0, 0, 1])
+                self.assertEqual(
+                    list(model.objects.filter(user=self.reader).values_list(
+                        'recipe_id', flat=True,
+                    )),
+                    [third],
+                )
+
+    def test_subscribe(self):
+        url = '/api/users/subscribe/batch/'
+        data = self.post(url, {'add': [self.author.pk, 999]})
+        self.assertEqual(self.statuses(data), {
+            ('add', self.author.pk): 'added',
+            ('add', 999): 'not_found',
+        })
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        data = self.post(url, {'remove': [self.author.pk]})
+        self.assertEqual(self.statuses(data), {
+            ('remove', self.author.pk): 'removed',
+        })
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+
+    def test_same_id_in_both_lists(self):
+        pk = self.recipes[0].pk
+        for url in (
+            '/api/recipes/favorite/batch/',
+            '/api/recipes/shopping_cart/batch/',
+            '/api/users/subscribe/batch/',
+        ):
+            with self.subTest(url=url):
+                self.post(url, {'add': [pk], 'remove': [pk]}, 400)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_anonymous(self):
+        response = APIClient().post(
+            '/api/recipes/favorite/batch/',
+            {'add': [self.recipes[0].pk]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class FeedTest(TestCase):
+    """Лента подписок пополняется новыми рецептами, очищается при
+    отписке и листается курсором без повторов
+    """
+
+    def setUp(self):
+        use_temporary_media(self)
+        self.reader = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+        )
+        self.authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='password',
+            )
+            for number in range(2)
+        ]
+        for author in self.authors:
+            create_recipes(author, 3, [], [])
+        # Одинаковое время публикации проверяет порядок по id
+        Recipe.objects.update(pub_date=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        for author in self.authors:
+            response = self.client.get(f'/api/users/{author.pk}/subscribe/')
+            self.assertEqual(response.status_code, 200)
+
+    def feed_ids(self, url='/api/recipes/feed/?limit=100'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def expected_ids(self, authors):
+        ids = list(FeedItem.objects.filter(
+            user=self.reader,
+            author__in=authors,
+        ).order_by('-pub_date', '-id').values_list('recipe_id', flat=True))
+        self.assertCountEqual(
+            ids,
+            Recipe.objects.filter(author__in=authors).values_list(
+                'id', flat=True,
+            ),
+        )
+        return ids
+
+    def test_subscription_fills_feed(self):
+        self.assertEqual(self.feed_ids(), self.expected_ids(self.authors))
+
+    def test_new_recipe_reaches_followers(self):
+        recipe = Recipe.objects.create(
+            author=self.authors[0],
+            name='Новый рецепт',
+            image=jpeg(),
+            text='Описание',
+            cooking_time=10,
+        )
+        self.assertEqual(self.feed_ids()[0], recipe.pk)
+        self.assertEqual(
+            FeedItem.objects.filter(recipe=recipe).count(),
+            1,
+        )
+
+    def test_unsubscribe_removes_author(self):
+        response = self.client.delete(
+            f'/api/users/{self.authors[0].pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.feed_ids(), self.expected_ids(self.authors[1:]))
+
+    def test_next_page_continues_without_duplicates(self):
+        ids = []
+        url = '/api/recipes/feed/?limit=4&count=1'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 6)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, self.expected_ids(self.authors))
+
+    def test_anonymous(self):
+        response = APIClient().get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 401)
+
+
+class LoadDataTest(TestCase):
+    """Загрузка с --truncate удаляет неиспользуемые ингредиенты и
+    сбрасывает справочник один раз
+    """
+
+    def test_truncate(self):
+        author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        used = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(5)
+        ])
+        create_recipes(author, 1, [], [used])
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'ingredients.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('Сахар,г\nСоль,г\n')
+        with mock.patch.object(ingredient_catalog, 'invalidate') as reset:
+            call_command(
+                'load_data',
+                path=path,
+                truncate=True,
+                stdout=StringIO(),
+            )
+            reset.assert_called_once()
+            Ingredient.objects.get(name='Сахар').delete()
+            self.assertEqual(reset.call_count, 2)
+        self.assertEqual(
+            list(Ingredient.objects.values_list('name', flat=True)),
+            ['Соль'],
+        )
+
+
+class ShoppingCartExportTest(TestCase):
+    """Список покупок выгружается во всех поддерживаемых форматах
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+        )
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(100)
+        ])
+        recipes = create_recipes(cls.user, 2, [], ingredients)
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=cls.user, recipe=recipe) for recipe in recipes
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, file_format):
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/?file_format={file_format}'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_txt(self):
+        _, content = self.download('txt')
+        self.assertIn('Ингредиент 0 (г) - 2', content.decode())
+
+    def test_csv(self):
+        _, content = self.download('csv')
+        self.assertEqual(len(content.decode().splitlines()), 101)
+
+    def test_units_are_merged(self):
+        user = User.objects.create_user(
+            username='cook',
+            email='cook@example.com',
+            password='password',
+        )
+        ingredients = {
+            unit: Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (
+                ('Мука', 'кг'), ('Мука', 'г'),
+                ('Молоко', 'ст. л.'), ('Молоко', 'мл'),
+            )
+        }
+        first, second = create_recipes(user, 2, [], [])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient=ingredients[unit],
+                amount=amount,
+            )
+            for recipe, unit, amount in (
+                (first, 'кг', 1), (first, 'ст. л.', 2),
+                (second, 'г', 500), (second, 'мл', 100),
+            )
+        ])
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=user, recipe=first),
+            ShoppingCart(user=user, recipe=second),
+        ])
+        self.client.force_authenticate(user)
+        _, content = self.download('txt')
+        self.assertEqual(
+            content.decode().splitlines(),
+            ['Мука (г) - 1500', 'Молоко (мл) - 130'],
+        )
+
+    def test_pdf(self):
+        response, content = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'DejaVuSans', content)
+        self.assertEqual(content.count(b'/Type /Page\n'), 3)
+
+
+class ThumbnailTest(TestCase):
+    """URL уменьшенных копий меняются вместе с ETag рецепта
+    """
+
+    def setUp(self):
+        use_temporary_media(self)
+        cache.clear()
+        author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        self.recipe = Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            image=jpeg(),
+            text='Описание',
+            cooking_time=10,
+        )
+
+    def test_etag_changes_when_thumbnails_are_ready(self):
+        client = APIClient()
+        url = f'/api/recipes/{self.recipe.pk}/'
+        response = client.get(url)
+        self.assertTrue(response.data['image_small'].endswith('.jpg'))
+
+        make_thumbnails_safely(self.recipe.image.name)
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['image_small'].endswith('_small.webp'))
+
+    @mock.patch('api.thumbnails.close_old_connections')
+    def test_task_closes_connections(self, close_old_connections):
+        with mock.patch(
+            'api.thumbnails.make_thumbnails',
+            side_effect=OSError,
+        ), self.assertLogs('api.thumbnails', 'ERROR'):
+            make_thumbnails_safely(self.recipe.image.name)
+        self.assertEqual(close_old_connections.call_count, 2)
+
+
+class GenerateThumbnailsTest(TestCase):
+    """Картинка, общая для нескольких рецептов, обрабатывается один раз
+    """
+
+    def test_shared_image_is_rendered_once(self):
+        use_temporary_media(self)
+        author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        name = image_storage.save('api/images/recipes/a.jpg', jpeg())
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=author,
+                name=f'Рецепт {number}',
+                image=name,
+                text='Описание',
+                cooking_time=10,
+            )
+            for number in range(3)
+        ])
+        with mock.patch(
+            'api.management.commands.generate_thumbnails.make_thumbnails',
+            wraps=make_thumbnails,
+        ) as render:
+            call_command('generate_thumbnails', stdout=StringIO())
+        render.assert_called_once()
+        self.assertFalse(
+            Recipe.objects.filter(thumbnails_ready=False).exists()
+        )
+        directory = os.path.dirname(image_storage.path(name))
+        self.assertEqual(
+            len(os.listdir(directory)),
+            1 + len(settings.THUMBNAIL_SIZES),
+        )
+
+
+def png_header(width, height):
+    """Заголовок PNG с размерами width x height без данных картинки
+    """
+
+    def chunk(kind, data):
+        body = kind + data
+        return (
+            struct.pack('>I', len(data)) + body
+            + struct.pack('>I', zlib.crc32(body))
+        )
+
+    return b'\x89PNG\r\n\x1a\n' + chunk(
+        b'IHDR',
+        struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0),
+    ) + chunk(b'IDAT', b'') + chunk(b'IEND', b'')
+
+
+class RecipeImageFieldTest(TestCase):
+    """Некорректное значение картинки возвращает 400, а не ошибку
+    сервера
+    """
+
+    def setUp(self):
+        user = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def post(self, image, **kwargs):
+        response = self.client.post(
+            '/api/recipes/',
+            {
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'image': image,
+                'tags': [],
+                'ingredients': [],
+            },
+            **kwargs,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+        return response
+
+    def test_invalid_image_values(self):
+        for image in (123, {}, [], 'picture.jpg', 'data:image/png,abc'):
+            with self.subTest(image=image):
+                self.post(image, format='json')
+
+    def test_decompression_bomb(self):
+        header = png_header(20000, 20000)
+        encoded = base64.b64encode(header).decode()
+        self.post(f'data:image/png;base64,{encoded}', format='json')
+        self.post(
+            ContentFile(header, name='bomb.png'),
+            format='multipart',
+        )
+
+
+class RecipeCounterTest(TestCase):
+    """Счётчик рецептов автора пересчитывается при создании и удалении
+    рецепта через API и не уходит в минус
+    """
+
+    def setUp(self):
+        use_temporary_media(self)
+        self.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def recipes_count(self):
+        self.author.refresh_from_db(fields=['recipes_count'])
+        return self.author.recipes_count
+
+    def test_create_and_delete(self):
+        tag = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        ingredient = Ingredient.objects.create(
+            name='Соль',
+            measurement_unit='г',
+        )
+        encoded = base64.b64encode(jpeg().read()).decode()
+        response = self.client.post(
+            '/api/recipes/',
+            {
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'image': f'data:image/jpeg;base64,{encoded}',
+                'tags': [tag.pk],
+                'ingredients': [{'id': ingredient.pk, 'amount': 5}],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.recipes_count(), 1)
+        response = self.client.delete(f'/api/recipes/{response.data["id"]}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.recipes_count(), 0)
+
+    def test_delete_recipe_created_without_counter(self):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            image=jpeg(),
+            text='Описание',
+            cooking_time=10,
+        )
+        self.assertEqual(self.recipes_count(), 0)
+        response = self.client.delete(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Recipe.objects.filter(pk=recipe.pk).exists())
+        self.assertEqual(self.recipes_count(), 0)
+
+
+class ImageReleaseTest(TestCase):
+    """Удаление картинки не теряет файл, который одновременно
+    загружают заново
+    """
+
+    def setUp(self):
+        use_temporary_media(self)
+        self.name = image_storage.save('api/images/recipes/a.jpg', jpeg())
+        make_thumbnails_safely(self.name)
+        self.thumbnail = thumbnail_name(self.name, 'small')
+
+    def test_recently_saved_file_is_kept(self):
+        self.assertEqual(
+            image_storage.save('api/images/recipes/b.jpg', jpeg()),
+            self.name,
+        )
+        self.assertFalse(delete_unused_image(self.name))
+        self.assertTrue(image_storage.exists(self.name))
+
+    @override_settings(IMAGE_RELEASE_GRACE=0)
+    def test_referenced_file_is_kept(self):
+        author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            image=self.name,
+            text='Описание',
+            cooking_time=10,
+        )
+        self.assertFalse(delete_unused_image(self.name))
+        self.assertTrue(image_storage.exists(self.name))
+
+    @override_settings(IMAGE_RELEASE_GRACE=0)
+    def test_unused_file_is_deleted(self):
+        self.assertTrue(delete_unused_image(self.name))
+        self.assertFalse(image_storage.exists(self.name))
+        self.assertFalse(image_storage.exists(self.thumbnail))
+        self.assertEqual(
+            image_storage.save('api/images/recipes/b.jpg', jpeg()),
+            self.name,
+        )
+        self.assertTrue(image_storage.exists(self.name))
+
+
+class DedupeImagesTest(TestCase):
+    """Старый файл, на который ссылаются несколько рецептов,
+    переименовывается один раз
+    """
+
+    def test_shared_legacy_file(self):
+        use_temporary_media(self)
+        author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        legacy = 'api/images/recipes/Plov_1.jpg'
+        FileSystemStorage().save(legacy, jpeg())
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=author,
+                name=f'Плов {number}',
+                image=legacy,
+                text='Описание',
+                cooking_time=10,
+            )
+            for number in range(3)
+        ])
+        stdout, stderr = StringIO(), StringIO()
+        call_command('dedupe_images', stdout=stdout, stderr=stderr)
+        self.assertEqual(stderr.getvalue(), '')
+        self.assertIn('Renamed: 1,', stdout.getvalue())
+        self.assertIn('missing files: 0,', stdout.getvalue())
+        names = set(Recipe.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertNotEqual(names, {legacy})
+        self.assertTrue(image_storage.exists(names.pop()))
+
+
+@skipUnless(connection.vendor in FULL_SCAN, 'Нет правил для планов запросов')
+class QueryPlanTest(TestCase):
+    """Горячие запросы читают таблицы по индексам
+    """
+
+    def assert_index_plans(self, queries):
+        with prefer_indexes():
+            for name, queryset, tables, ordered in queries:
+                with self.subTest(query=name):
+                    plan, problems = plan_problems(queryset, tables, ordered)
+                    self.assertEqual(problems, [], plan)
+
+    def test_hot_queries_use_indexes(self):
+        self.assert_index_plans(hot_queries(1, 1, 1))
+
+    @skipUnless(
+        connection.vendor == 'postgresql',
+        'Индексы для поиска создаются только в PostgreSQL',
+    )
+    def test_ingredient_search_uses_indexes(self):
+        self.assert_index_plans(postgresql_queries())
@@ -0,0 +1,138 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {
+    'WEBP': '.webp',
+    'JPEG': '.jpg',
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.THUMBNAIL_WORKERS,
+    thread_name_prefix='thumbnails',
+)
+
+
+def thumbnail_name(name, size):
+    """Возвращает имя уменьшенной копии картинки name размера size.
+
+    Копия лежит в той же папке, что и оригинал, поэтому её имя
+    вычисляется без обращения к базе данных.
+    """
+
+    stem, _ = os.path.splitext(name)
+    return f'{stem}_{size}{EXTENSIONS[settings.THUMBNAIL_FORMAT]}'
+
+
+def thumbnail_url(image, size):
+    """Возвращает URL уменьшенной копии картинки.
+
+    URL вычисляется только по имени картинки, без обращения к
+    хранилищу. Готовность копий хранится в Recipe.thumbnails_ready.
+    """
+
+    return image.storage.url(thumbnail_name(image.name, size))
+
+
+def mark_thumbnails_ready(name):
+    """Отмечает, что у рецептов с картинкой name есть уменьшенные
+    копии.
+
+    Вместе с флагом меняется updated_at, поэтому ETag рецепта
+    меняется, и клиенты получают новые URL вместо ответа 304.
+    """
+
+    return Recipe.objects.filter(image=name, thumbnails_ready=False).update(
+        thumbnails_ready=True,
+        updated_at=timezone.now(),
+    )
+
+
+def render_thumbnail(image, dimensions):
+    thumbnail = image.copy()
+    thumbnail.thumbnail(dimensions, Image.LANCZOS)
+    if settings.THUMBNAIL_FORMAT == 'JPEG' and thumbnail.mode != 'RGB':
+        thumbnail = thumbnail.convert('RGB')
+    buffer = BytesIO()
+    thumbnail.save(
+        buffer,
+        settings.THUMBNAIL_FORMAT,
+        quality=settings.THUMBNAIL_QUALITY,
+        optimize=True,
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def make_thumbnails(name, storage=default_storage, overwrite=False):
+    """Создаёт недостающие уменьшенные копии картинки name и возвращает
+    количество созданных файлов
+    """
+
+    names = {
+        size: thumbnail_name(name, size)
+        for size in settings.THUMBNAIL_SIZES
+    }
+    if not overwrite:
+        names = {
+            size: thumbnail
+            for size, thumbnail in names.items()
+            if not storage.exists(thumbnail)
+        }
+    if not names:
+        return 0
+    with storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    for size, thumbnail in names.items():
+        content = render_thumbnail(image, settings.THUMBNAIL_SIZES[size])
+        if storage.exists(thumbnail):
+            storage.delete(thumbnail)
+        storage.save(thumbnail, content)
+    return len(names)
+
+
+def delete_thumbnails(name, storage=default_storage):
+    for size in settings.THUMBNAIL_SIZES:
+        storage.delete(thumbnail_name(name, size))
+
+
+def make_thumbnails_safely(name):
+    """Создаёт уменьшенные копии картинки name в потоке пула.
+
+    Потоки пула живут долго, поэтому соединение с базой закрывается
+    до и после задачи, как это делает Django для запросов: иначе после
+    перезапуска базы поток продолжал бы работать со сломанным
+    соединением.
+    """
+
+    close_old_connections()
+    try:
+        make_thumbnails(name)
+        mark_thumbnails_ready(name)
+    except Exception:
+        logger.exception('Не удалось создать превью для %s', name)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnails(name):
+    """Ставит создание уменьшенных копий картинки name в пул потоков
+    после фиксации текущей транзакции
+    """
+
+    if name:
+        transaction.on_commit(
+            lambda: executor.submit(make_thumbnails_safely, name)
+        )
@@ -0,0 +1,115 @@
+from django.db import transaction
+
+from .counters import count_subquery
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+
+
+def get_target_field(model, field):
+    return model._meta.get_field(field)
+
+
+def refresh_counter(model, field, counter, ids):
+    """Пересчитывает счётчик counter у объектов, на которые ссылается
+    поле field модели model, по текущему числу связей
+    """
+
+    target = get_target_field(model, field).related_model
+    target._default_manager.filter(pk__in=ids).update(
+        **{counter: count_subquery(model.objects.all(), field)}
+    )
+
+
+def add_links(model, field, counter, user, ids, on_add=None):
+    """Создаёт связи пользователя с объектами ids одним запросом
+    INSERT ... ON CONFLICT DO NOTHING и пересчитывает их счётчики.
+
+    Повторное добавление существующей связи не вызывает ошибку, а
+    пересчёт вместо инкремента оставляет счётчик верным при гонках.
+    Обработчик on_add(user, ids) выполняется в той же транзакции.
+    """
+
+    attname = get_target_field(model, field).attname
+    with transaction.atomic():
+        model.objects.bulk_create(
+            [model(user=user, **{attname: pk}) for pk in ids],
+            ignore_conflicts=True,
+        )
+        refresh_counter(model, field, counter, ids)
+        if on_add is not None:
+            on_add(user, ids)
+
+
+def remove_links(model, field, counter, user, ids, on_remove=None):
+    """Удаляет связи пользователя с объектами ids одним запросом и
+    возвращает число удалённых связей. Обработчик on_remove(user, ids)
+    выполняется в той же транзакции, если что-то было удалено
+    """
+
+    with transaction.atomic():
+        deleted, _ = model.objects.filter(
+            user=user,
+            **{f'{field}__in': ids},
+        ).delete()
+        if deleted:
+            refresh_counter(model, field, counter, ids)
+            if on_remove is not None:
+                on_remove(user, ids)
+    return deleted
+
+
+def toggle_links(model, field, counter, user, add=(), remove=(),
+                 on_add=None, on_remove=None):
+    """Добавляет и удаляет связи пользователя с объектами в одной
+    транзакции и возвращает статус каждого переданного id.
+
+    Связи создаются одним bulk_create, удаляются одним DELETE, а
+    счётчики пересчитываются одним UPDATE для всех затронутых объектов.
+    Обработчики on_add и on_remove получают только изменённые id.
+    """
+
+    target = get_target_field(model, field)
+    with transaction.atomic():
+        linked = set(model.objects.filter(
+            user=user,
+            **{f'{field}__in': [*add, *remove]},
+        ).values_list(target.attname, flat=True))
+        found = set(target.related_model._default_manager.filter(
+            pk__in=add,
+        ).values_list('pk', flat=True))
+        created = [pk for pk in add if pk in found and pk not in linked]
+        removed = [pk for pk in remove if pk in linked]
+        if created:
+            model.objects.bulk_create(
+                [model(user=user, **{target.attname: pk}) for pk in created],
+                ignore_conflicts=True,
+            )
+        if removed:
+            model.objects.filter(
+                user=user,
+                **{f'{field}__in': removed},
+            ).delete()
+        if created or removed:
+            refresh_counter(model, field, counter, [*created, *removed])
+        if created and on_add is not None:
+            on_add(user, created)
+        if removed and on_remove is not None:
+            on_remove(user, removed)
+
+    results = []
+    for pk in add:
+        if pk not in found:
+            result = NOT_FOUND
+        elif pk in linked:
+            result = EXISTS
+        else:
+            result = ADDED
+        results.append({'id': pk, 'action': 'add', 'status': result})
+    for pk in remove:
+        result = REMOVED if pk in linked else MISSING
+        results.append({'id': pk, 'action': 'remove', 'status': result})
+    return results
@@ -0,0 +1,40 @@
+from django.db.models import Case, CharField, F, IntegerField, Value, When
+
+# Единицы измерения из api/data/ingredients.csv, которые приводятся
+# к базовой единице: единица -> (базовая единица, множитель)
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+    'стакан': ('мл', 200),
+    'ст. л.': ('мл', 15),
+    'ч. л.': ('мл', 5),
+}
+
+
+def build_unit_expressions(field):
+    """Возвращает выражения CASE для базовой единицы измерения и
+    множителя перевода в неё для поля field
+    """
+
+    base_unit = Case(
+        *[
+            When(**{field: unit}, then=Value(base))
+            for unit, (base, _) in UNIT_CONVERSIONS.items()
+        ],
+        default=F(field),
+        output_field=CharField(),
+    )
+    factor = Case(
+        *[
+            When(**{field: unit}, then=Value(multiplier))
+            for unit, (_, multiplier) in UNIT_CONVERSIONS.items()
+        ],
+        default=Value(1),
+        output_field=IntegerField(),
+    )
+    return base_unit, factor
+
+
+BASE_UNIT, UNIT_FACTOR = build_unit_expressions(
+    'ingredient__measurement_unit',
+)
@@ -1,8 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
-                    SubscriptionListViewSet, TagViewSet)
+from .views import (CustomUserViewSet, IngredientViewSet, MetricsView,
+                    RecipeViewSet, SubscriptionListViewSet, TagViewSet)
 
 router = DefaultRouter()
 
@@ -18,6 +18,7 @@ urlpatterns = [
         SubscriptionListViewSet.as_view({'get': 'list'}),
         name='subscriptions',
     ),
+    path('internal/metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
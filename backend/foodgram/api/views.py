@@ -1,28 +1,43 @@
+from collections import defaultdict
+from functools import partial
+from hashlib import md5
+
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum
-from django.http import HttpResponse
-from django.shortcuts import get_list_or_404, get_object_or_404
+from django.db import transaction
+from django.db.models import F, Value
+from django.http import HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .filters import IngredientSearchFilter, RecipeFilter
-from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                     ShoppingCart, Subscription, Tag)
-from .pagination import CustomPagination
+from .cache import ingredient_catalog, tag_catalog
+from .feed import follow, unfollow
+from .filters import RecipeFilter
+from .metrics import registry
+from .mixins import ConditionalGetMixin, MetricsMixin
+from .models import (Favorite, FeedItem, Ingredient, Recipe, ShoppingCart,
+                     Subscription, Tag)
+from .pagination import CustomPagination, KeysetPagination
 from .permissions import (IsAdminOrReadOnly, RecipePermission,
                           SubscriptionListPermission)
-from .serializers import (IngredientSerializer, RecipeCreateUpdateSerializer,
-                          RecipeListSerializer, RecipeMinifiedSerializer,
-                          SubscriptionListSerializer, SubscriptionSerializer,
-                          TagSerializer)
+from .search import ingredient_autocomplete
+from .serializers import (BatchToggleSerializer, IngredientSerializer,
+                          RecipeCreateUpdateSerializer, RecipeListSerializer,
+                          RecipeMinifiedSerializer, SubscriptionListSerializer,
+                          SubscriptionSerializer, TagSerializer)
+from .shopping_cart import EXPORT_FORMATS, get_shopping_cart
+from .toggles import add_links, refresh_counter, remove_links, toggle_links
 
 User = get_user_model()
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(MetricsMixin, UserViewSet):
     """Набор представлений для обработки запросов на получение данных
     модели User, создания и удаления подписок
     """
@@ -33,34 +48,79 @@ class CustomUserViewSet(UserViewSet):
     def get_serializer_class(self):
         if self.action == 'subscribe':
             return SubscriptionSerializer
+        if self.action == 'subscribe_batch':
+            return BatchToggleSerializer
         return super().get_serializer_class()
 
     @action(methods=['get', 'delete',], detail=True)
     def subscribe(self, request, id=None):
         user_for_subscriprion_id = int(self.kwargs['id'])
-        user_for_subscriprion = get_object_or_404(
-            User,
-            id=user_for_subscriprion_id,
-        )
         user = request.user
         if request.method == 'GET':
-            subscriprion = Subscription.objects.create(
-                user=user,
-                subscriptions=user_for_subscriprion,
+            user_for_subscriprion = get_object_or_404(
+                User,
+                id=user_for_subscriprion_id,
+            )
+            add_links(
+                Subscription,
+                'subscriptions',
+                'subscribers_count',
+                user,
+                [user_for_subscriprion.pk],
+                on_add=follow,
             )
             serializer = self.get_serializer(user_for_subscriprion)
             return Response(serializer.data)
         elif request.method == 'DELETE':
-            subscriprion = get_object_or_404(
+            if not remove_links(
                 Subscription,
-                user=user,
-                subscriptions=user_for_subscriprion,
-            )
-            subscriprion.delete()
+                'subscriptions',
+                'subscribers_count',
+                user,
+                [user_for_subscriprion_id],
+                on_remove=unfollow,
+            ):
+                raise NotFound()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        methods=['post'],
+        detail=False,
+        url_path='subscribe/batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    def subscribe_batch(self, request):
+        return batch_response(
+            self,
+            request,
+            Subscription,
+            'subscriptions',
+            'subscribers_count',
+            on_add=follow,
+            on_remove=unfollow,
+        )
+
 
-class TagViewSet(viewsets.ModelViewSet):
+def batch_response(view, request, model, field, counter, **hooks):
+    serializer = view.get_serializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    results = toggle_links(
+        model,
+        field,
+        counter,
+        request.user,
+        **serializer.validated_data,
+        **hooks,
+    )
+    return Response({'results': results})
+
+
+def catalog_response(snapshot):
+    return HttpResponse(snapshot.payload, content_type='application/json')
+
+
+class TagViewSet(MetricsMixin, ConditionalGetMixin,
+                 viewsets.ModelViewSet):
     """Набор представлений для обработки запросов на получение данных 
     модели Tag
     """
@@ -69,8 +129,18 @@ class TagViewSet(viewsets.ModelViewSet):
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
 
+    def list(self, request, *args, **kwargs):
+        snapshot = tag_catalog.get()
+        return self.respond_conditionally(
+            request,
+            f'tag-{snapshot.version}',
+            snapshot.updated_at,
+            partial(catalog_response, snapshot),
+        )
+
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(MetricsMixin, ConditionalGetMixin,
+                        viewsets.ModelViewSet):
     """Набор представлений для обработки запросов на получение данных 
     модели Ingredient
     """
@@ -78,11 +148,31 @@ class IngredientViewSet(viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class =IngredientSearchFilter
+
+    def list(self, request, *args, **kwargs):
+        snapshot = ingredient_catalog.get()
+        name = request.query_params.get('name')
+        if name:
+            get_response = partial(self.search, name)
+        else:
+            get_response = partial(catalog_response, snapshot)
+        return self.respond_conditionally(
+            request,
+            f'ingredient-{snapshot.version}',
+            snapshot.updated_at,
+            get_response,
+        )
+
+    def search(self, name):
+        serializer = self.get_serializer(
+            ingredient_autocomplete.search(name),
+            many=True,
+        )
+        return Response(serializer.data)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(MetricsMixin, ConditionalGetMixin,
+                    viewsets.ModelViewSet):
     """Набор представлений для обработки запросов на получение данных 
     модели Recipe, добавления рецептов в избранное и список покупок,
     удаления из избранного и списка покупок, скачивания списка покупок
@@ -90,74 +180,157 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     queryset = Recipe.objects.all()
     pagination_class = CustomPagination
+    keyset_ordering = ('-pub_date', '-id')
+    conditional_vary = ('Authorization',)
     http_method_names = ('get', 'post', 'put', 'patch', 'delete',)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (RecipePermission,)
 
+    def get_queryset(self):
+        if self.action in ('favorite', 'shopping_cart'):
+            return self.queryset
+        return self.queryset.with_list_relations().with_user_flags(
+            self.request.user,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        version = get_object_or_404(
+            Recipe.objects.with_user_flags(request.user).values_list(
+                'updated_at',
+                'is_favorited',
+                'is_in_shopping_cart',
+                'author_is_subscribed',
+                'author__email',
+                'author__username',
+                'author__first_name',
+                'author__last_name',
+            ),
+            pk=self.kwargs['pk'],
+        )
+        tags = tag_catalog.get()
+        ingredients = ingredient_catalog.get()
+        etag = md5(
+            repr((version, tags.version, ingredients.version)).encode()
+        ).hexdigest()
+        # Признаки избранного и подписки не меняют updated_at, поэтому
+        # для авторизованных пользователей полагаемся только на ETag
+        last_modified = None
+        if request.user.is_anonymous:
+            last_modified = max(
+                stamp for stamp in (
+                    version[0], tags.updated_at, ingredients.updated_at,
+                ) if stamp is not None
+            )
+        return self.respond_conditionally(
+            request,
+            f'recipe-{etag}',
+            last_modified,
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            serializer.save(author=self.request.user)
+            refresh_counter(
+                Recipe, 'author', 'recipes_count', [self.request.user.pk],
+            )
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            refresh_counter(
+                Recipe, 'author', 'recipes_count', [instance.author_id],
+            )
 
     def get_serializer_class(self):
-        if self.request.method == 'GET':
-            return RecipeListSerializer
         if self.action == 'favorite' or self.action == 'shopping_cart':
             return RecipeMinifiedSerializer
+        if self.action in ('favorite_batch', 'shopping_cart_batch'):
+            return BatchToggleSerializer
+        if self.request.method == 'GET':
+            return RecipeListSerializer
         return RecipeCreateUpdateSerializer
 
-    def get_data(self, request, model):
+    def get_data(self, request, model, counter):
         recipe_id = int(self.kwargs['pk'])
-        recipe = get_object_or_404(Recipe, id=recipe_id)
         user = request.user
         if request.method == 'GET':
-            model.objects.create(user=user, recipe=recipe)
+            recipe = get_object_or_404(
+                self.get_queryset().only(
+                    'id', 'name', 'image', 'cooking_time', 'thumbnails_ready',
+                ),
+                id=recipe_id,
+            )
+            add_links(model, 'recipe', counter, user, [recipe.pk])
             serializer = self.get_serializer(recipe)
             return Response(serializer.data)
         if request.method == 'DELETE':
-            searchable_object = get_object_or_404(
-                model,
-                user=user,
-                recipe=recipe,
-            )
-            searchable_object.delete()
+            if not remove_links(model, 'recipe', counter, user, [recipe_id]):
+                raise NotFound()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(methods=['get', 'delete'], detail=True)
     def favorite(self, request, pk=None):
-        return self.get_data(request, Favorite)
+        return self.get_data(request, Favorite, 'favorites_count')
 
     @action(methods=['get', 'delete',], detail=True)
     def shopping_cart(self, request, pk=None):
-        return self.get_data(request, ShoppingCart)
+        return self.get_data(request, ShoppingCart, 'shopping_cart_count')
+
+    @action(methods=['post'], detail=False, url_path='favorite/batch')
+    def favorite_batch(self, request):
+        return batch_response(
+            self, request, Favorite, 'recipe', 'favorites_count',
+        )
+
+    @action(methods=['post'], detail=False, url_path='shopping_cart/batch')
+    def shopping_cart_batch(self, request):
+        return batch_response(
+            self, request, ShoppingCart, 'recipe', 'shopping_cart_count',
+        )
+
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        paginator = KeysetPagination()
+        items = paginator.paginate_queryset(
+            FeedItem.objects.filter(user=request.user).only(
+                'id', 'recipe', 'pub_date',
+            ),
+            request,
+            self,
+        )
+        recipes = self.get_queryset().in_bulk(
+            [item.recipe_id for item in items],
+        )
+        serializer = self.get_serializer(
+            [recipes[item.recipe_id] for item in items
+             if item.recipe_id in recipes],
+            many=True,
+        )
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False)
     def download_shopping_cart(self, request):
-        items = IngredientInRecipe.objects.select_related(
-            'recipe',
-            'ingredient',
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError({
+                'file_format': [
+                    f'Доступные форматы: {", ".join(EXPORT_FORMATS)}'
+                ],
+            })
+        render, content_type = EXPORT_FORMATS[file_format]
+        items = get_shopping_cart(request.user)
+        filename = f'Shopping_cart.{file_format}'
+        response = StreamingHttpResponse(
+            render(items),
+            content_type=content_type,
         )
-        items = items.filter(
-            recipe__in_shopping_cart__user=request.user,
-        )
-        items = items.values(
-            'ingredient__name',
-            'ingredient__measurement_unit',
-        ).annotate(
-            name=F('ingredient__name'),
-            units=F('ingredient__measurement_unit'),
-            total=Sum('amount'),
-        ).order_by('-total')
-        text='\n'.join([
-            f"{item['name']} ({item['units']}) - {item['total']}"
-            for item in items
-        ])
-        filename = 'Shopping_cart'
-        response = HttpResponse(text, content_type='text/plain')
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
 
-class SubscriptionListViewSet(viewsets.ModelViewSet):
+class SubscriptionListViewSet(MetricsMixin, viewsets.ModelViewSet):
     """Набор представлений для обработки запросов на получение списка
     подписчиков текущего пользователя
     """
@@ -165,9 +338,47 @@ class SubscriptionListViewSet(viewsets.ModelViewSet):
     serializer_class = SubscriptionListSerializer
     permission_classes = (SubscriptionListPermission,)
     pagination_class = CustomPagination
+    keyset_ordering = ('-subscription_id',)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        context = self.get_serializer_context()
+        context['recipes_by_author'] = self.get_recipes_by_author(page)
+        serializer = self.get_serializer(page, many=True, context=context)
+        return self.get_paginated_response(serializer.data)
+
+    def get_recipes_by_author(self, authors):
+        recipes_by_author = defaultdict(list)
+        if not authors:
+            return recipes_by_author
+        recipes = Recipe.objects.filter(author__in=authors).only(
+            'id', 'name', 'image', 'cooking_time', 'thumbnails_ready',
+            'author',
+        )
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit:
+            recipes = recipes.top_by_author(int(recipes_limit))
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        return recipes_by_author
 
     def get_queryset(self):
-        return get_list_or_404(
-            User,
-            subscribed_to__user = self.request.user,
+        return User.objects.filter(
+            subscribed_to__user=self.request.user,
+        ).annotate(
+            subscription_id=F('subscribed_to__id'),
+            is_subscribed=Value(True),
+        ).order_by('-subscription_id')
+
+
+class MetricsView(APIView):
+    """Представление для выгрузки метрик запросов в формате Prometheus
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
         )
@@ -39,7 +39,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -79,6 +79,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+REQUEST_METRICS = os.getenv('REQUEST_METRICS') == '1'
+
+if REQUEST_METRICS:
+    MIDDLEWARE.insert(0, 'api.middleware.RequestMetricsMiddleware')
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -142,3 +147,71 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 20))
+
+CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', 1))
+
+SHOPPING_CART_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_CART_CACHE_TIMEOUT', 60 * 60)
+)
+
+THUMBNAIL_SIZES = {
+    'small': (320, 320),
+    'medium': (640, 640),
+}
+
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'WEBP')
+
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', 80))
+
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 20 * 1024 * 1024)
+)
+
+RECIPE_IMAGE_MAX_DIMENSION = int(
+    os.getenv('RECIPE_IMAGE_MAX_DIMENSION', 8000)
+)
+
+RECIPE_IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+IMAGE_RELEASE_GRACE = int(os.getenv('IMAGE_RELEASE_GRACE', 600))
+
+BATCH_TOGGLE_MAX_ITEMS = int(os.getenv('BATCH_TOGGLE_MAX_ITEMS', 500))
+
+REQUEST_BUDGET_DEFAULT = {
+    'queries': int(os.getenv('REQUEST_BUDGET_QUERIES', 20)),
+    'db_ms': float(os.getenv('REQUEST_BUDGET_DB_MS', 200)),
+}
+
+REQUEST_BUDGETS = {
+    'RecipeViewSet.list': {'queries': 8},
+    'RecipeViewSet.retrieve': {'queries': 8},
+    'SubscriptionListViewSet.list': {'queries': 6},
+    'CustomUserViewSet.subscribe': {'queries': 8},
+    'TagViewSet.list': {'queries': 2},
+    'IngredientViewSet.list': {'queries': 2},
+}
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+
+# Сколько секунд другие воркеры могут принимать отозванный токен,
+# если TOKEN_CACHE_SHARED выключен
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', 10))
+
+# Включать только с кэшем, общим для всех воркеров (CACHE_BACKEND)
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED') == '1'
+
+TOKEN_CACHE_SHARED_TTL = int(os.getenv('TOKEN_CACHE_SHARED_TTL', 300))
@@ -8,3 +8,4 @@ from .models import CustomUser
 class CustomUserAdmin(UserAdmin):
     list_display = ['email', 'username', 'first_name', 'last_name']
     list_filter = ('email', 'username',)
+    readonly_fields = ('recipes_count', 'subscribers_count',)
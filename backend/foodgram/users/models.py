@@ -7,6 +7,14 @@ class CustomUser(AbstractUser):
     """
 
     email = models.EmailField(unique=True)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов',
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков',
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [